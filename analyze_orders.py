@@ -1,148 +1,264 @@
+import os
 import sqlite3
+import sys
 import re
-from collections import defaultdict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from rich.console import Console
 from rich.table import Table
 
 console = Console()
 
-def extract_order_info(subject, body, from_addr, to_addr, date):
-    """Extract order information from email content."""
-    order_info = {
-        'order_numbers': [],
-        'status_keywords': [],
-        'persons': set(),
-        'issues': [],
-        'date': date
-    }
+# Common order number patterns, fused into one alternation so each email is
+# scanned once; every branch has exactly one capture group.
+ORDER_RE = re.compile(
+    r'order\s*#?\s*(\d{4,})'
+    r'|order\s*number[:\s]*(\d{4,})'
+    r'|#(\d{5,})'
+    r'|po[:\s#]*(\d{4,})'
+    r'|invoice[:\s#]*(\d{4,})'
+    r'|confirmation[:\s#]*(\d{4,})'
+)
+
+# Issues that need rectification, one named group per cue
+ISSUE_RE = re.compile(
+    r'(?P<urgent>urgent[^.]*\.)'
+    r'|(?P<asap>asap[^.]*\.)'
+    r'|(?P<problem>problem[^.]*\.)'
+    r'|(?P<issue>issue[^.]*\.)'
+    r'|(?P<please_fix>please\s+fix[^.]*\.)'
+    r'|(?P<need_to>need\s+to[^.]*\.)'
+    r'|(?P<missing>missing[^.]*\.)'
+    r'|(?P<wrong>wrong[^.]*\.)'
+    r'|(?P<delayed>delayed[^.]*\.)'
+    r'|(?P<complaint>complaint[^.]*\.)'
+)
+ISSUE_MATCH_LIMIT = 2  # Max matches kept per issue cue
+MAX_ISSUES_PER_EMAIL = 20
+
+# Status keywords
+STATUS_KEYWORDS = {
+    'pending': ['pending', 'waiting', 'on hold', 'processing'],
+    'shipped': ['shipped', 'dispatched', 'sent', 'delivered', 'tracking'],
+    'cancelled': ['cancelled', 'canceled', 'refund', 'refunded'],
+    'problem': ['problem', 'issue', 'error', 'failed', 'delay', 'delayed', 'wrong', 'missing', 'damaged', 'complaint', 'urgent', 'asap'],
+    'confirmed': ['confirmed', 'confirmation', 'approved', 'accepted'],
+    'payment': ['payment', 'paid', 'invoice', 'receipt'],
+}
+# Single-word keywords are matched by set intersection against the email's
+# word tokens; multi-word phrases ('on hold') fall back to a substring check.
+STATUS_TOKENS = {
+    status: frozenset(kw for kw in kws if ' ' not in kw)
+    for status, kws in STATUS_KEYWORDS.items()
+}
+STATUS_PHRASES = [
+    (kw, status) for status, kws in STATUS_KEYWORDS.items() for kw in kws if ' ' in kw
+]
+WORD_RE = re.compile(r'\w+')
+
+# Rows shipped to each worker process per task
+BATCH_SIZE = 2000
+
+# Order/issue cues live near the top of an email; quoted replies and HTML
+# leftovers below this many characters are not scanned. Tunable.
+BODY_SCAN_LIMIT = 16384
+
+EMAIL_RE = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+
+def split_addresses(header):
+    """Split a From/To header like 'Name <a@x.com>, b@y.com' into bare addresses."""
+    addrs = []
+    for part in header.split(','):
+        part = part.strip()
+        if '<' in part:
+            part = part[part.rfind('<') + 1:].rstrip('>').strip()
+        if '@' in part:
+            addrs.append(part)
+    return addrs
+
+class OrderInfo:
+    """Order numbers, statuses, persons and issues found in one email."""
+    __slots__ = ('order_numbers', 'status_keywords', 'persons', 'issues', 'date')
     
-    # Common order number patterns
-    order_patterns = [
-        r'order\s*#?\s*(\d{4,})',
-        r'order\s*number[:\s]*(\d{4,})',
-        r'#(\d{5,})',
-        r'po[:\s#]*(\d{4,})',
-        r'invoice[:\s#]*(\d{4,})',
-        r'confirmation[:\s#]*(\d{4,})',
-    ]
+    def __init__(self, date):
+        self.order_numbers = []
+        self.status_keywords = set()
+        self.persons = set()
+        self.issues = []
+        self.date = date
+
+class OrderBucket:
+    """Aggregated emails, statuses and persons for a single order number."""
+    __slots__ = ('subjects', 'statuses', 'persons', 'issues', 'email_ids', 'max_date')
     
-    text = f"{subject} {body}".lower()
+    def __init__(self):
+        self.subjects = []
+        self.statuses = set()
+        self.persons = set()
+        self.issues = []
+        self.email_ids = []
+        self.max_date = ''  # Latest email date, kept up to date on insert
+
+def extract_order_info(subject, body, from_addr, to_addr, date):
+    """Extract order information from email content.
     
-    for pattern in order_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        order_info['order_numbers'].extend(matches)
+    All patterns are authored in lowercase and matched against the
+    lowercased subject + body, so no case-insensitive flag is needed.
+    Only the first BODY_SCAN_LIMIT characters of the body are scanned
+    (analyze_emails already truncates it in SQL).
+    """
+    order_info = OrderInfo(date)
     
-    # Status keywords
-    status_keywords = {
-        'pending': ['pending', 'waiting', 'on hold', 'processing'],
-        'shipped': ['shipped', 'dispatched', 'sent', 'delivered', 'tracking'],
-        'cancelled': ['cancelled', 'canceled', 'refund', 'refunded'],
-        'problem': ['problem', 'issue', 'error', 'failed', 'delay', 'delayed', 'wrong', 'missing', 'damaged', 'complaint', 'urgent', 'asap'],
-        'confirmed': ['confirmed', 'confirmation', 'approved', 'accepted'],
-        'payment': ['payment', 'paid', 'invoice', 'receipt'],
-    }
+    text = subject.lower()
+    body_l = ''
+    if body:
+        body_l = body[:BODY_SCAN_LIMIT].lower()
+        text = text + ' ' + body_l
     
-    for status, keywords in status_keywords.items():
-        for kw in keywords:
-            if kw in text:
-                order_info['status_keywords'].append(status)
-                break
+    for m in ORDER_RE.finditer(text):
+        order_info.order_numbers.append(m.group(m.lastindex))
     
-    # Extract email addresses as persons involved
-    email_pattern = r'[\w\.-]+@[\w\.-]+\.\w+'
-    emails = re.findall(email_pattern, f"{from_addr} {to_addr} {body}")
-    order_info['persons'].update(emails)
+    # Status keywords - tokenize once, then O(1) set lookups per category
+    tokens = frozenset(WORD_RE.findall(text))
+    found = order_info.status_keywords
+    for status, kws in STATUS_TOKENS.items():
+        if not tokens.isdisjoint(kws):
+            found.add(status)
+    for phrase, status in STATUS_PHRASES:
+        if status not in found and phrase in text:
+            found.add(status)
     
-    # Look for issues that need rectification
-    issue_patterns = [
-        r'(urgent[^.]*\.)',
-        r'(asap[^.]*\.)',
-        r'(problem[^.]*\.)',
-        r'(issue[^.]*\.)',
-        r'(please\s+fix[^.]*\.)',
-        r'(need\s+to[^.]*\.)',
-        r'(missing[^.]*\.)',
-        r'(wrong[^.]*\.)',
-        r'(delayed[^.]*\.)',
-        r'(complaint[^.]*\.)',
-    ]
+    # Extract email addresses as persons involved - header fields are plain
+    # address lists, so only the body needs the regex. Addresses are lowercased
+    # so the same person is not counted twice under different casing.
+    for hdr in (from_addr, to_addr):
+        if hdr and '@' in hdr:
+            order_info.persons.update(addr.lower() for addr in split_addresses(hdr))
+    if body_l:
+        order_info.persons.update(EMAIL_RE.findall(body_l))
     
-    for pattern in issue_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        order_info['issues'].extend(matches[:2])  # Limit to 2 matches per pattern
+    # Look for issues that need rectification
+    # Duplicate sentences (e.g. repeated in quoted replies) are dropped on capture
+    issue_counts = {}
+    seen = set()
+    for m in ISSUE_RE.finditer(text):
+        cue = m.lastgroup
+        issue = m.group(cue)
+        if issue in seen or issue_counts.get(cue, 0) >= ISSUE_MATCH_LIMIT:
+            continue
+        seen.add(issue)
+        issue_counts[cue] = issue_counts.get(cue, 0) + 1
+        order_info.issues.append(issue)
+        if len(seen) >= MAX_ISSUES_PER_EMAIL:
+            break
     
     return order_info
 
+def _extract_batch(rows):
+    """Run extract_order_info over a batch of (id, subject, from, to, date, body) tuples.
+    
+    Top-level so it can be pickled to ProcessPoolExecutor workers.
+    """
+    results = []
+    for email_id, subject, from_addr, to_addr, date, body in rows:
+        subject = subject or ''
+        info = extract_order_info(subject, body or '', from_addr, to_addr, date)
+        results.append((email_id, subject, from_addr, date, info))
+    return results
+
+def iter_order_infos(cursor, batch_size=BATCH_SIZE):
+    """Yield (id, subject, from, date, info) for every row, extracted in parallel.
+    
+    At most two batches per worker are in flight, so rows stay streamed from
+    the cursor instead of being materialized up front. Results keep row order.
+    """
+    workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        pending = deque()
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            pending.append(ex.submit(_extract_batch, [tuple(row) for row in rows]))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
 def analyze_emails():
     """Analyze all emails for order information."""
     db_path = 'email_archive.db'
     
     with sqlite3.connect(db_path) as conn:
         conn.row_factory = sqlite3.Row
+        # Tune the connection for a read-only full-table scan: WAL so the app can
+        # keep writing meanwhile, 128 MB page cache, 1 GB memory map, and no writes
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA cache_size=-131072')
+        conn.execute('PRAGMA mmap_size=1073741824')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA query_only=1')
         cursor = conn.cursor()
+        cursor.arraysize = 1000
         
         # Get total count
         cursor.execute('SELECT COUNT(*) as count FROM emails')
         total = cursor.fetchone()['count']
         console.print(f"\n[bold green]Total emails in database: {total}[/]")
         
-        # Get all emails
+        # Stream all emails - rows are pulled lazily instead of materialized up front.
+        # Bodies are truncated in SQL so text past the scan limit never leaves SQLite.
         cursor.execute('''
-            SELECT id, subject, from_address, to_address, date_received, body_text 
+            SELECT id, subject, from_address, to_address, date_received,
+                   SUBSTR(body_text, 1, ?) as body_text
             FROM emails 
             ORDER BY date_received DESC
-        ''')
-        
-        emails = cursor.fetchall()
+        ''', (BODY_SCAN_LIMIT,))
         
         # Analyze
-        orders = defaultdict(lambda: {
-            'subjects': [],
-            'statuses': set(),
-            'persons': set(),
-            'issues': [],
-            'dates': [],
-            'email_ids': []
-        })
+        orders = {}
         
         all_persons = set()
         all_issues = []
         problem_emails = []
         
-        for email in emails:
-            body = email['body_text'] or ''
-            subject = email['subject'] or ''
-            
-            info = extract_order_info(
-                subject, 
-                body, 
-                email['from_address'], 
-                email['to_address'],
-                email['date_received']
-            )
-            
-            # Track problems
-            if 'problem' in info['status_keywords'] or info['issues']:
+        for email_id, subject, from_addr, date, info in iter_order_infos(cursor):
+            # Track problems (status_keywords is a set, so this is O(1))
+            if 'problem' in info.status_keywords or info.issues:
                 problem_emails.append({
-                    'id': email['id'],
+                    'id': email_id,
                     'subject': subject,
-                    'from': email['from_address'],
-                    'date': email['date_received'],
-                    'issues': info['issues']
+                    'from': from_addr,
+                    'date': date,
+                    'issues': info.issues
                 })
             
+            # Intern addresses so every bucket shares one string object per person
+            persons = [sys.intern(p) for p in info.persons]
+            
             # Track by order number
-            for order_num in info['order_numbers']:
-                orders[order_num]['subjects'].append(subject)
-                orders[order_num]['statuses'].update(info['status_keywords'])
-                orders[order_num]['persons'].update(info['persons'])
-                orders[order_num]['issues'].extend(info['issues'])
-                orders[order_num]['dates'].append(info['date'])
-                orders[order_num]['email_ids'].append(email['id'])
+            for order_num in info.order_numbers:
+                bucket = orders.get(order_num)
+                if bucket is None:
+                    bucket = orders[order_num] = OrderBucket()
+                bucket.subjects.append(subject)
+                bucket.statuses.update(info.status_keywords)
+                bucket.persons.update(persons)
+                bucket.issues.extend(info.issues)
+                if info.date and info.date > bucket.max_date:
+                    bucket.max_date = info.date
+                bucket.email_ids.append(email_id)
             
-            all_persons.update(info['persons'])
-            all_issues.extend(info['issues'])
+            all_persons.update(persons)
+            all_issues.extend(info.issues)
+        
+        # Sort once and reuse for both the console tables and the report file.
+        # The report needs both lists in full order, so slicing the single sort
+        # is cheaper than an extra heapq.nlargest/nsmallest pass for the top 50.
+        sorted_orders = sorted(orders.items(), key=lambda x: x[1].max_date, reverse=True)
+        sorted_persons = sorted(all_persons)
         
         # Display Orders Table
         console.print("\n[bold magenta]═══ ORDERS FOUND ═══[/]")
@@ -155,20 +271,22 @@ def analyze_emails():
             order_table.add_column("Email Count", width=10)
             order_table.add_column("Persons Involved", width=40)
             
-            for order_num, data in sorted(orders.items(), key=lambda x: x[1]['dates'][-1] if x[1]['dates'] else '', reverse=True)[:50]:
-                statuses = ', '.join(data['statuses']) if data['statuses'] else 'Unknown'
-                last_date = max(data['dates']) if data['dates'] else 'N/A'
-                persons = ', '.join(list(data['persons'])[:3])
-                if len(data['persons']) > 3:
-                    persons += f" (+{len(data['persons'])-3} more)"
-                
-                order_table.add_row(
+            # Prepare all row tuples first, then hand them to Rich
+            order_rows = []
+            for order_num, data in sorted_orders[:50]:
+                persons = ', '.join(list(data.persons)[:3])
+                if len(data.persons) > 3:
+                    persons += f" (+{len(data.persons)-3} more)"
+                order_rows.append((
                     order_num,
-                    statuses,
-                    str(last_date)[:19] if last_date else 'N/A',
-                    str(len(data['email_ids'])),
+                    ', '.join(data.statuses) if data.statuses else 'Unknown',
+                    str(data.max_date)[:19] if data.max_date else 'N/A',
+                    str(len(data.email_ids)),
                     persons
-                )
+                ))
+            
+            for row in order_rows:
+                order_table.add_row(*row)
             
             console.print(order_table)
         else:
@@ -184,13 +302,17 @@ def analyze_emails():
             issue_table.add_column("From", width=30)
             issue_table.add_column("Subject", width=50)
             
-            for prob in problem_emails[:30]:  # Show top 30
-                issue_table.add_row(
+            issue_rows = [
+                (
                     str(prob['id']),
                     str(prob['date'])[:19] if prob['date'] else 'N/A',
-                    prob['from'][:30],
+                    (prob['from'] or '')[:30],
                     prob['subject'][:50]
                 )
+                for prob in problem_emails[:30]  # Show top 30
+            ]
+            for row in issue_rows:
+                issue_table.add_row(*row)
             
             console.print(issue_table)
             console.print(f"\n[bold]Total emails with potential issues: {len(problem_emails)}[/]")
@@ -203,49 +325,52 @@ def analyze_emails():
         person_table = Table(show_header=True, header_style="bold blue")
         person_table.add_column("Email Address", width=50)
         
-        for person in sorted(all_persons)[:50]:
+        for person in sorted_persons[:50]:
             person_table.add_row(person)
         
         console.print(person_table)
         console.print(f"\n[bold]Total unique email addresses: {len(all_persons)}[/]")
         
-        # Save detailed report to file
+        # Build the detailed report in memory and write it in one call
+        buf = []
+        buf.append("EMAIL ANALYSIS REPORT\n")
+        buf.append("=" * 80 + "\n")
+        buf.append(f"Generated: {datetime.now()}\n")
+        buf.append(f"Total Emails Analyzed: {total}\n\n")
+        
+        buf.append("ORDERS FOUND\n")
+        buf.append("-" * 80 + "\n")
+        for order_num, data in sorted_orders:
+            buf.append(f"\nOrder #{order_num}\n")
+            buf.append(f"  Statuses: {', '.join(data.statuses) if data.statuses else 'Unknown'}\n")
+            buf.append(f"  Email Count: {len(data.email_ids)}\n")
+            buf.append(f"  Persons: {', '.join(data.persons)}\n")
+            buf.append(f"  Subjects:\n")
+            for subj in data.subjects[:5]:
+                buf.append(f"    - {subj}\n")
+            if data.issues:
+                buf.append(f"  Issues:\n")
+                for issue in data.issues[:3]:
+                    buf.append(f"    ! {issue}\n")
+        
+        buf.append("\n\nISSUES REQUIRING IMMEDIATE ATTENTION\n")
+        buf.append("-" * 80 + "\n")
+        for prob in problem_emails:
+            buf.append(f"\nEmail ID: {prob['id']}\n")
+            buf.append(f"  Date: {prob['date']}\n")
+            buf.append(f"  From: {prob['from']}\n")
+            buf.append(f"  Subject: {prob['subject']}\n")
+            if prob['issues']:
+                for issue in prob['issues']:
+                    buf.append(f"  Issue: {issue}\n")
+        
+        buf.append("\n\nALL PERSONS INVOLVED\n")
+        buf.append("-" * 80 + "\n")
+        for person in sorted_persons:
+            buf.append(f"  {person}\n")
+        
         with open('order_analysis_report.txt', 'w') as f:
-            f.write("EMAIL ANALYSIS REPORT\n")
-            f.write("=" * 80 + "\n")
-            f.write(f"Generated: {datetime.now()}\n")
-            f.write(f"Total Emails Analyzed: {total}\n\n")
-            
-            f.write("ORDERS FOUND\n")
-            f.write("-" * 80 + "\n")
-            for order_num, data in sorted(orders.items(), key=lambda x: x[1]['dates'][-1] if x[1]['dates'] else '', reverse=True):
-                f.write(f"\nOrder #{order_num}\n")
-                f.write(f"  Statuses: {', '.join(data['statuses']) if data['statuses'] else 'Unknown'}\n")
-                f.write(f"  Email Count: {len(data['email_ids'])}\n")
-                f.write(f"  Persons: {', '.join(data['persons'])}\n")
-                f.write(f"  Subjects:\n")
-                for subj in data['subjects'][:5]:
-                    f.write(f"    - {subj}\n")
-                if data['issues']:
-                    f.write(f"  Issues:\n")
-                    for issue in data['issues'][:3]:
-                        f.write(f"    ! {issue}\n")
-            
-            f.write("\n\nISSUES REQUIRING IMMEDIATE ATTENTION\n")
-            f.write("-" * 80 + "\n")
-            for prob in problem_emails:
-                f.write(f"\nEmail ID: {prob['id']}\n")
-                f.write(f"  Date: {prob['date']}\n")
-                f.write(f"  From: {prob['from']}\n")
-                f.write(f"  Subject: {prob['subject']}\n")
-                if prob['issues']:
-                    for issue in prob['issues']:
-                        f.write(f"  Issue: {issue}\n")
-            
-            f.write("\n\nALL PERSONS INVOLVED\n")
-            f.write("-" * 80 + "\n")
-            for person in sorted(all_persons):
-                f.write(f"  {person}\n")
+            f.write(''.join(buf))
         
         console.print("\n[green]Full report saved to: order_analysis_report.txt[/]")
 
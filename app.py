@@ -1,29 +1,89 @@
 import os
 import json
 import re
-from flask import Flask, render_template, request, jsonify, redirect, session, url_for
+import gzip
+from flask import Flask, Response, render_template, request, jsonify, redirect, session, url_for, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_compress import Compress
-from collections import defaultdict
 import requests
+from requests.adapters import HTTPAdapter
 import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime
 from dotenv import load_dotenv
 from database import (
     get_db_connection, get_cursor, execute_query, fetchall, fetchone,
-    init_all_tables, get_setting, set_setting, USE_POSTGRES, IntegrityError
+    init_all_tables, get_setting, set_setting, delete_setting, USE_POSTGRES, IntegrityError,
+    FTS_TABLES, fts_match_expression, PARSED_INVOICES_VERSION_SETTING, ENTITY_CATEGORIES_VERSION_SETTING
 )
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
 
-# Enable gzip compression for responses
-Compress(app)
+# Enable Brotli/gzip compression for responses (configured before Compress
+# reads COMPRESS_ALGORITHM in init_app)
 app.config['COMPRESS_MIMETYPES'] = ['text/html', 'text/css', 'text/javascript', 'application/json', 'application/javascript']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
 app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_BR_LEVEL'] = 4
 app.config['COMPRESS_MIN_SIZE'] = 500
+Compress(app)
+
+STREAM_BATCH_SIZE = 500
+
+def stream_json_rows(conn, cursor, prefix='[', suffix=']'):
+    """Stream an executed query's rows as a JSON array, one fetched batch at a time.
+    
+    Rows are serialized with app.json, so the body is the same JSON jsonify(rows) would give
+    (without its trailing newline) and no row list or encoded copy is held in memory. The
+    connection is closed once the last batch has been sent. Flask-Compress compresses
+    streamed responses with COMPRESS_ALGORITHM_STREAMING (br/zstd/deflate), not gzip.
+    """
+    def generate():
+        try:
+            yield prefix
+            separator = ''
+            while True:
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                yield separator + ','.join(map(app.json.dumps, rows))
+                separator = ','
+            yield suffix
+        finally:
+            conn.close()
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, so every jsonify() skips the stdlib encoder.
+    
+    Key order, separators and the HTTP-date format match the default provider; the one
+    difference is that non-ASCII text is sent as UTF-8 rather than \\u escapes.
+    """
+    # Dates still go through Flask's default hook so responses keep the same HTTP-date format
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+    
+    def dumps(self, obj, **kwargs):
+        # Flask sorts keys by default (app.json.sort_keys); keep that ordering
+        option = self.option | orjson.OPT_SORT_KEYS if kwargs.get('sort_keys', self.sort_keys) else self.option
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 
 # Google Calendar API configuration
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
@@ -31,39 +91,83 @@ GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_OAUTH_CLIENT_ID', '')
 GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_OAUTH_CLIENT_SECRET', '')
 GOOGLE_REDIRECT_URI = os.environ.get('GOOGLE_REDIRECT_URI', 'http://localhost:8080/api/calendar/callback')
 GOOGLE_SCOPES = ['https://www.googleapis.com/auth/calendar.readonly', 'https://www.googleapis.com/auth/tasks.readonly']
-GOOGLE_TOKEN_FILE = 'google_tokens.json'
+GOOGLE_TOKENS_SETTING = 'google_tokens'
+
+# Access token memoized briefly so calendar/tasks polling skips the database
+GOOGLE_TOKEN_CACHE_SECONDS = 60
+google_token_cache = {'token': None, 'expires': 0.0}
 
 def save_google_tokens(tokens):
-    """Save Google tokens to file."""
-    with open(GOOGLE_TOKEN_FILE, 'w') as f:
-        json.dump(tokens, f)
+    """Save Google tokens to app_settings."""
+    set_setting(GOOGLE_TOKENS_SETTING, json.dumps(tokens))
+    google_token_cache['expires'] = 0.0
 
-def load_google_tokens():
-    """Load Google tokens from file."""
-    if os.path.exists(GOOGLE_TOKEN_FILE):
-        with open(GOOGLE_TOKEN_FILE, 'r') as f:
-            return json.load(f)
+def parse_google_tokens(value):
+    """Decode the stored google_tokens setting, None if it is unset."""
+    if value:
+        return orjson.loads(value) if orjson is not None else json.loads(value)
     return None
 
+def load_google_tokens():
+    """Load Google tokens from app_settings."""
+    return parse_google_tokens(get_setting(GOOGLE_TOKENS_SETTING))
+
+def clear_google_tokens():
+    """Forget stored Google tokens (disconnect)."""
+    delete_setting(GOOGLE_TOKENS_SETTING)
+    google_token_cache['expires'] = 0.0
+
+def expire_google_token(access_token):
+    """Handle a 401 for access_token: drop the stored tokens only if they still hold it.
+    
+    The memo is per worker, so the rejected token may be stale here while another
+    worker has already saved a fresh connection; that one must survive.
+    """
+    google_token_cache['expires'] = 0.0
+    value = get_setting(GOOGLE_TOKENS_SETTING)
+    tokens = parse_google_tokens(value)
+    if tokens and tokens.get('access_token') == access_token:
+        delete_setting(GOOGLE_TOKENS_SETTING, value)
+
 def get_google_access_token():
     """Get valid Google access token, refreshing if needed."""
+    now = time.monotonic()
+    if google_token_cache['expires'] > now:
+        return google_token_cache['token']
     tokens = load_google_tokens()
-    if not tokens:
-        return None
-    return tokens.get('access_token')
+    token = tokens.get('access_token') if tokens else None
+    google_token_cache['token'] = token
+    google_token_cache['expires'] = now + GOOGLE_TOKEN_CACHE_SECONDS
+    return token
 
-# Disable caching for development
+# Disable caching for development, except where a response sets its own policy
 @app.after_request
 def add_header(response):
+    if 'Cache-Control' in response.headers:
+        return response
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     return response
 
+def etag_matches(etag):
+    """True if the request's If-None-Match names etag (Flask-Compress suffixes it with ':gzip' etc.)."""
+    for tag in request.headers.get('If-None-Match', '').split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"').split(':')[0] == etag:
+            return True
+    return False
+
 # Perplexity API configuration
 PERPLEXITY_API_KEY = os.environ.get('PERPLEXITY_API_KEY', '')
 PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
 
+# Keep-alive session so /api/ask reuses the TLS connection to Perplexity
+perplexity_session = requests.Session()
+perplexity_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
 # Database path for SQLite (local dev) - PostgreSQL is configured via DATABASE_URL env var
 DB_PATH = 'email_archive.db'
 
@@ -103,140 +207,264 @@ def init_chromadb():
         print("ChromaDB not installed. Install with: pip install chromadb sentence-transformers")
         return None, None, None
 
-chroma_client, emails_collection, invoices_collection = init_chromadb()
+# Loaded on first use: the embedding model is slow to import and only the
+# ChromaDB endpoints need it
+chroma_state = None
+chroma_lock = threading.Lock()
+
+def get_chroma():
+    """Return (chroma_client, emails_collection, invoices_collection), initializing once."""
+    global chroma_state
+    if chroma_state is None:
+        with chroma_lock:
+            if chroma_state is None:
+                chroma_state = init_chromadb()
+    return chroma_state
+
+# Recent collection.query() results, LRU with a TTL; embedding the query text and
+# walking the index is the slow part of every semantic lookup
+CHROMA_QUERY_CACHE_SIZE = 256
+CHROMA_QUERY_CACHE_SECONDS = 300
+chroma_query_cache = OrderedDict()
+chroma_query_cache_lock = threading.Lock()
+# generation is bumped by every reindex so in-flight queries don't cache stale results
+chroma_query_cache_stats = {'hits': 0, 'misses': 0, 'generation': 0}
+
+def cached_chroma_query(collection, query_text, n_results):
+    """Run collection.query() for one text, reusing a recent identical query's results."""
+    key = (collection.name, query_text, n_results)
+    now = time.time()
+    with chroma_query_cache_lock:
+        entry = chroma_query_cache.get(key)
+        if entry is not None and entry[0] > now:
+            chroma_query_cache.move_to_end(key)
+            chroma_query_cache_stats['hits'] += 1
+            return entry[1]
+        chroma_query_cache_stats['misses'] += 1
+        generation = chroma_query_cache_stats['generation']
+    
+    results = collection.query(
+        query_texts=[query_text],
+        n_results=n_results,
+        include=['metadatas', 'distances']
+    )
+    
+    with chroma_query_cache_lock:
+        if generation == chroma_query_cache_stats['generation']:
+            chroma_query_cache[key] = (now + CHROMA_QUERY_CACHE_SECONDS, results)
+            chroma_query_cache.move_to_end(key)
+            while len(chroma_query_cache) > CHROMA_QUERY_CACHE_SIZE:
+                chroma_query_cache.popitem(last=False)
+    return results
+
+def clear_chroma_query_cache():
+    """Forget cached query results after a collection has been (re)indexed."""
+    with chroma_query_cache_lock:
+        chroma_query_cache.clear()
+        chroma_query_cache_stats['generation'] += 1
+
+# Patterns used by extract_entities_and_orders, compiled once at import
+# One pass over the text; a bare '#' still needs 5+ digits, so it gets its own group
+COMBINED_ORDER_RE = re.compile(
+    r'(?:order\s*#?\s*|order\s*number[:\s]*|po[:\s#]*|invoice[:\s#]*)(\d{4,})|#(\d{5,})',
+    re.IGNORECASE
+)
+ENTITY_STATUS_KEYWORDS = {
+    'pending': ['pending', 'waiting', 'on hold', 'processing'],
+    'shipped': ['shipped', 'dispatched', 'sent', 'delivered', 'tracking'],
+    'cancelled': ['cancelled', 'canceled', 'refund'],
+    'problem': ['problem', 'issue', 'error', 'failed', 'delay', 'urgent', 'asap'],
+    'confirmed': ['confirmed', 'confirmation', 'approved'],
+    'payment': ['payment', 'paid', 'invoice'],
+}
+KEYWORD_TO_STATUS = {kw: status for status, kws in ENTITY_STATUS_KEYWORDS.items() for kw in kws}
+# Keywords anchor at a word start so 'delay' still finds 'delayed' but 'sent' skips 'present'
+STATUS_RE = re.compile(
+    r'\b(' + '|'.join(map(re.escape, sorted(KEYWORD_TO_STATUS, key=len, reverse=True))) + ')'
+)
+EMAIL_ANGLE_RE = re.compile(r'<([^>]+@[^>]+)>')
+EMAIL_BARE_RE = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+NAME_RE = re.compile(r'^([^<]+)')
+# System senders to leave out of entity lists
+SKIP_SENDER_RE = re.compile(r'mailer-daemon|no-?reply|accounts\.google')
+
+# Senders repeat across hundreds of emails, so most calls are cache hits
+@lru_cache(maxsize=8192)
+def parse_sender(from_addr):
+    """Return (address, display name) for a raw From header."""
+    email_match = EMAIL_ANGLE_RE.search(from_addr)
+    if email_match:
+        addr = email_match.group(1).lower()
+    else:
+        addr_match = EMAIL_BARE_RE.search(from_addr)
+        addr = addr_match.group(0).lower() if addr_match else from_addr.lower()
+    
+    name_match = NAME_RE.match(from_addr)
+    name = name_match.group(1).strip().strip('"') if name_match else addr.split('@')[0]
+    return addr, name
 
 def extract_entities_and_orders():
     """Extract all entities with their emails and orders."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
+    # Entity state as parallel lists indexed by addr_index[addr]; the result
+    # dicts are only built once at the end
+    addr_index = {}
+    addrs, names, companies = [], [], []
+    email_counts, last_contacts = [], []
+    orders, statuses, seen_orders = [], [], []
+    
+    # Counts and last contact come straight from SQLite; several raw From
+    # headers can map to the same address, so merge the groups here
     cursor.execute('''
-        SELECT id, subject, from_address, to_address, date_received, body_text 
-        FROM emails 
-        ORDER BY date_received DESC
+        SELECT from_address, MAX(date_received) as last_contact, COUNT(*) as email_count
+        FROM emails
+        GROUP BY from_address
+        ORDER BY last_contact DESC
     ''')
     
-    emails = cursor.fetchall()
-    conn.close()
-    
-    # Entity extraction
-    entities = defaultdict(lambda: {
-        'name': '',
-        'email': '',
-        'company': '',
-        'orders': [],
-        'last_contact': '',
-        'email_count': 0,
-        'statuses': set()
-    })
-    
-    # Order patterns
-    order_patterns = [
-        r'order\s*#?\s*(\d{4,})',
-        r'order\s*number[:\s]*(\d{4,})',
-        r'po[:\s#]*(\d{4,})',
-        r'invoice[:\s#]*(\d{4,})',
-        r'#(\d{5,})',
-    ]
-    
-    # Status keywords
-    status_keywords = {
-        'pending': ['pending', 'waiting', 'on hold', 'processing'],
-        'shipped': ['shipped', 'dispatched', 'sent', 'delivered', 'tracking'],
-        'cancelled': ['cancelled', 'canceled', 'refund'],
-        'problem': ['problem', 'issue', 'error', 'failed', 'delay', 'urgent', 'asap'],
-        'confirmed': ['confirmed', 'confirmation', 'approved'],
-        'payment': ['payment', 'paid', 'invoice'],
-    }
-    
-    for email in emails:
-        from_addr = email['from_address'] or ''
-        subject = email['subject'] or ''
-        body = email['body_text'] or ''
-        text = f"{subject} {body}".lower()
-        
-        # Extract email address
-        email_match = re.search(r'<([^>]+@[^>]+)>', from_addr)
-        if email_match:
-            addr = email_match.group(1).lower()
-        else:
-            addr_match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', from_addr)
-            addr = addr_match.group(0).lower() if addr_match else from_addr.lower()
+    for row in cursor.fetchall():
+        from_addr = row['from_address'] or ''
+        addr, name = parse_sender(from_addr)
         
         # Skip system emails
-        if any(x in addr for x in ['mailer-daemon', 'noreply', 'no-reply', 'accounts.google']):
+        if SKIP_SENDER_RE.search(addr):
             continue
         
-        # Extract name
-        name_match = re.match(r'^([^<]+)', from_addr)
-        name = name_match.group(1).strip().strip('"') if name_match else addr.split('@')[0]
-        
         # Extract company from domain
         domain = addr.split('@')[-1] if '@' in addr else ''
         company = domain.split('.')[0].title() if domain else ''
         
         # Update entity
-        entities[addr]['email'] = addr
-        entities[addr]['name'] = name
-        entities[addr]['company'] = company
-        entities[addr]['email_count'] += 1
+        i = addr_index.get(addr)
+        if i is None:
+            i = addr_index[addr] = len(addrs)
+            addrs.append(addr)
+            names.append(name)
+            companies.append(company)
+            email_counts.append(0)
+            last_contacts.append('')
+            orders.append([])
+            statuses.append(set())
+            seen_orders.append(set())
+        else:
+            names[i] = name
+            companies[i] = company
+        email_counts[i] += row['email_count']
         
-        if not entities[addr]['last_contact'] or email['date_received'] > entities[addr]['last_contact']:
-            entities[addr]['last_contact'] = email['date_received']
+        if row['last_contact'] and (not last_contacts[i] or row['last_contact'] > last_contacts[i]):
+            last_contacts[i] = row['last_contact']
+    
+    # Stream bodies for order extraction instead of holding them all at once
+    cursor.execute('''
+        SELECT from_address, subject, body_text
+        FROM emails 
+        ORDER BY date_received DESC
+    ''')
+    
+    # Bound once so the per-email loop skips the global/attribute lookups
+    find_orders = COMBINED_ORDER_RE.finditer
+    find_status_keywords = STATUS_RE.findall
+    get_index = addr_index.get
+    
+    for email in cursor:
+        addr, _ = parse_sender(email['from_address'] or '')
+        i = get_index(addr)
+        if i is None:
+            continue
+        
+        subject = email['subject'] or ''
+        body = email['body_text'] or ''
+        text = f"{subject} {body}".lower()
         
         # Extract orders
-        for pattern in order_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for order_num in matches:
-                if order_num not in [o['number'] for o in entities[addr]['orders']]:
-                    # Determine status
-                    order_statuses = []
-                    for status, keywords in status_keywords.items():
-                        if any(kw in text for kw in keywords):
-                            order_statuses.append(status)
-                    
-                    entities[addr]['orders'].append({
-                        'number': order_num,
-                        'subject': subject[:100],
-                        'statuses': order_statuses or ['unknown']
-                    })
-                    entities[addr]['statuses'].update(order_statuses)
+        entity_seen = seen_orders[i]
+        order_statuses = None
+        for m in find_orders(text):
+            order_num = m.group(1) or m.group(2)
+            if order_num not in entity_seen:
+                entity_seen.add(order_num)
+                # Determine status once per email, in ENTITY_STATUS_KEYWORDS order
+                if order_statuses is None:
+                    found = {KEYWORD_TO_STATUS[kw] for kw in find_status_keywords(text)}
+                    order_statuses = [st for st in ENTITY_STATUS_KEYWORDS if st in found]
+                
+                orders[i].append({
+                    'number': order_num,
+                    'subject': subject[:100],
+                    'statuses': order_statuses or ['unknown']
+                })
+                statuses[i].update(order_statuses)
+    
+    conn.close()
     
     # Convert to list and sort by email count
-    result = []
-    for addr, data in entities.items():
-        data['statuses'] = list(data['statuses'])
-        result.append(data)
+    result = [
+        {
+            'name': names[i],
+            'email': addrs[i],
+            'company': companies[i],
+            'orders': orders[i],
+            'last_contact': last_contacts[i],
+            'email_count': email_counts[i],
+            'statuses': list(statuses[i])
+        }
+        for i in range(len(addrs))
+    ]
     
     result.sort(key=lambda x: x['email_count'], reverse=True)
     return result
 
+# Last extract_entities_and_orders result, keyed on the emails table's (COUNT, MAX(id))
+entities_cache = {'version': None, 'etag': None, 'entities': None, 'json': None, 'json_gzip': None}
+entities_cache_lock = threading.Lock()
+
+def get_cached_entities():
+    """Return (etag, entities, json_bytes, gzipped_json_bytes), recomputing only when emails change."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) as total, MAX(id) as max_id FROM emails')
+    row = cursor.fetchone()
+    conn.close()
+    version = (row['total'], row['max_id'])
+    
+    with entities_cache_lock:
+        if entities_cache['version'] != version:
+            entities = extract_entities_and_orders()
+            entities_cache['version'] = version
+            entities_cache['etag'] = f'{version[0]}-{version[1]}'
+            entities_cache['entities'] = entities
+            entities_cache['json'] = app.json.dumps(entities).encode('utf-8')
+            entities_cache['json_gzip'] = gzip.compress(entities_cache['json'], compresslevel=6)
+        return entities_cache['etag'], entities_cache['entities'], entities_cache['json'], entities_cache['json_gzip']
+
 def get_email_context(limit=50):
     """Get recent emails as context for the AI."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT subject, from_address, to_address, date_received, body_text 
+        SELECT subject, from_address, to_address, date_received, SUBSTR(body_text, 1, 500) as body_text
         FROM emails 
         ORDER BY date_received DESC 
         LIMIT ?
     ''', (limit,))
     
-    emails = cursor.fetchall()
-    conn.close()
-    
-    context = "Here are the recent emails from the DFW Professional sales inbox:\n\n"
-    for i, email in enumerate(emails, 1):
-        context += f"--- Email {i} ---\n"
-        context += f"From: {email['from_address']}\n"
-        context += f"To: {email['to_address']}\n"
-        context += f"Date: {email['date_received']}\n"
-        context += f"Subject: {email['subject']}\n"
+    parts = ["Here are the recent emails from the DFW Professional sales inbox:\n\n"]
+    for i, email in enumerate(cursor, 1):
         body = (email['body_text'] or '')[:500]
-        context += f"Body: {body}...\n\n"
+        parts.append(
+            f"--- Email {i} ---\n"
+            f"From: {email['from_address']}\n"
+            f"To: {email['to_address']}\n"
+            f"Date: {email['date_received']}\n"
+            f"Subject: {email['subject']}\n"
+            f"Body: {body}...\n\n"
+        )
+    conn.close()
     
-    return context
+    return ''.join(parts)
 
 def ask_perplexity(question, context):
     """Send a question to Perplexity API."""
@@ -261,9 +489,9 @@ dates, people involved, and action items. If you don't have enough information,
     }
     
     try:
-        response = requests.post(PERPLEXITY_API_URL, headers=headers, json=payload, timeout=30)
+        response = perplexity_session.post(PERPLEXITY_API_URL, headers=headers, json=payload, timeout=30)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content) if orjson is not None else response.json()
         return data['choices'][0]['message']['content']
     except Exception as e:
         return f"Error querying Perplexity API: {str(e)}"
@@ -273,6 +501,23 @@ def search_emails(query):
     conn = get_db_connection()
     cursor = conn.cursor()
     
+    match = '' if USE_POSTGRES else fts_match_expression(query)
+    if match:
+        try:
+            cursor.execute('''
+                SELECT e.id, e.subject, e.from_address, e.date_received, e.body_text
+                FROM emails_fts
+                JOIN emails e ON e.id = emails_fts.rowid
+                WHERE emails_fts MATCH ?
+                ORDER BY rank
+                LIMIT 20
+            ''', (match,))
+            results = cursor.fetchall()
+            conn.close()
+            return [dict(row) for row in results]
+        except Exception:
+            pass  # No FTS5 index in this SQLite build, fall back to LIKE
+    
     cursor.execute('''
         SELECT id, subject, from_address, date_received, body_text 
         FROM emails 
@@ -286,14 +531,64 @@ def search_emails(query):
     
     return [dict(row) for row in results]
 
+def search_rows(cursor, table, columns, query, limit=10):
+    """Rows of table matching query through its FTS5 index, or LIKE over columns without one."""
+    match = fts_match_expression(query) if table in FTS_TABLES and not USE_POSTGRES else ''
+    if match:
+        try:
+            cursor.execute(f'''
+                SELECT t.* FROM {table}_fts
+                JOIN {table} t ON t.id = {table}_fts.rowid
+                WHERE {table}_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ''', (match, limit))
+            return cursor.fetchall()
+        except Exception:
+            pass  # No FTS5 index in this SQLite build
+    
+    where = ' OR '.join(f'{col} LIKE ?' for col in columns)
+    cursor.execute(f'SELECT * FROM {table} WHERE {where}', tuple(f'%{query}%' for _ in columns))
+    return cursor.fetchall()
+
+# Long-lived workers so each keeps its pooled SQLite connection between /api/ask calls
+ask_executor = ThreadPoolExecutor(max_workers=7)
+
+def ask_lookup(table, columns, question, optional=False):
+    """Run one /api/ask table search on the worker thread's own connection."""
+    conn = get_db_connection()
+    try:
+        return search_rows(conn.cursor(), table, columns, question)
+    except Exception:
+        if optional:
+            return []  # Table may not exist yet
+        raise
+    finally:
+        conn.close()
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/api/entities')
 def get_entities():
-    entities = extract_entities_and_orders()
-    return jsonify(entities)
+    etag, _, entities_json, entities_gzip = get_cached_entities()
+    # The pre-compressed copy is only for clients that take gzip but not br; everyone else
+    # gets the plain body and Flask-Compress negotiates br (and suffixes the ETag) itself
+    accept_encodings = request.accept_encodings
+    use_gzip = accept_encodings.quality('gzip') > 0 and accept_encodings.quality('br') == 0
+    if etag_matches(etag):
+        response = Response(status=304)
+    elif use_gzip:
+        # Compressed once per cache fill; Flask-Compress skips responses that already have Content-Encoding
+        response = Response(entities_gzip, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(entities_json, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(f'{etag}:gzip' if use_gzip else etag)
+    response.headers['Cache-Control'] = 'private, max-age=5'
+    return response
 
 @app.route('/api/organisations')
 def get_organisations():
@@ -301,11 +596,17 @@ def get_organisations():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Get category overrides to identify customers
-    cursor.execute('SELECT domain, category FROM entity_categories')
-    category_overrides = {row['domain']: row['category'] for row in cursor.fetchall()}
+    # Customer domains and their saved billing/shipping details in one query
+    cursor.execute('''
+        SELECT ec.domain, od.domain as details_domain, od.billing_address, od.shipping_address
+        FROM entity_categories ec
+        LEFT JOIN organisation_details od ON od.domain = ec.domain
+        WHERE ec.category = 'customers'
+    ''')
+    customers = {row['domain']: row for row in cursor.fetchall()}
+    conn.close()
     
-    entities = extract_entities_and_orders()
+    _, entities, _, _ = get_cached_entities()
     
     # Group by domain - only include customers
     organisations = {}
@@ -315,46 +616,28 @@ def get_organisations():
             continue
         domain = email.split('@')[-1]
         
-        # Check if this domain is a customer
-        category = category_overrides.get(domain, 'other')
-        if category != 'customers':
+        customer = customers.get(domain)
+        if customer is None:
             continue
         
-        if domain not in organisations:
-            organisations[domain] = {
+        org = organisations.get(domain)
+        if org is None:
+            org = organisations[domain] = {
                 'domain': domain,
                 'name': domain.split('.')[0].upper(),
                 'contacts': [],
                 'total_emails': 0,
                 'total_orders': 0
             }
+            if customer['details_domain'] is not None:
+                org['billing_address'] = customer['billing_address']
+                org['shipping_address'] = customer['shipping_address']
         
-        organisations[domain]['contacts'].append(entity)
-        organisations[domain]['total_emails'] += entity.get('email_count', 0)
-        organisations[domain]['total_orders'] += len(entity.get('orders', []))
-    
-    # Get saved billing/shipping details from database
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS organisation_details (
-            domain TEXT PRIMARY KEY,
-            billing_address TEXT,
-            shipping_address TEXT,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('SELECT domain, billing_address, shipping_address FROM organisation_details')
-    saved_details = {row['domain']: {'billing': row['billing_address'], 'shipping': row['shipping_address']} 
-                     for row in cursor.fetchall()}
-    conn.close()
+        org['contacts'].append(entity)
+        org['total_emails'] += entity.get('email_count', 0)
+        org['total_orders'] += len(entity.get('orders', []))
     
-    # Add saved details to organisations
-    result = []
-    for domain, org in organisations.items():
-        if domain in saved_details:
-            org['billing_address'] = saved_details[domain]['billing']
-            org['shipping_address'] = saved_details[domain]['shipping']
-        result.append(org)
+    result = list(organisations.values())
     
     # Sort by total orders
     result.sort(key=lambda x: x['total_orders'], reverse=True)
@@ -374,15 +657,6 @@ def save_organisation_details():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS organisation_details (
-            domain TEXT PRIMARY KEY,
-            billing_address TEXT,
-            shipping_address TEXT,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
     cursor.execute('''
         INSERT OR REPLACE INTO organisation_details (domain, billing_address, shipping_address, updated_at)
         VALUES (?, ?, ?, CURRENT_TIMESTAMP)
@@ -402,11 +676,20 @@ def ask_question():
     if not question:
         return jsonify({'error': 'No question provided'}), 400
     
+    # All lookups are independent reads, so run them concurrently
+    context_future = ask_executor.submit(get_email_context, 30)
+    search_future = ask_executor.submit(search_emails, question)
+    products_future = ask_executor.submit(ask_lookup, 'products', ('name', 'description', 'notes'), question)
+    runs_future = ask_executor.submit(ask_lookup, 'production_runs', ('client', 'product', 'order_ref', 'notes'), question)
+    invoices_future = ask_executor.submit(ask_lookup, 'invoices', ('invoice_number', 'bill_to', 'notes'), question, True)
+    proformas_future = ask_executor.submit(ask_lookup, 'proforma_invoices', ('invoice_number', 'bill_to', 'notes'), question, True)
+    clients_future = ask_executor.submit(ask_lookup, 'clients', ('name', 'contact_info'), question)
+    
     # Get email context
-    context = get_email_context(limit=30)
+    context = context_future.result()
     
     # Also search for relevant emails
-    search_results = search_emails(question)
+    search_results = search_future.result()
     if search_results:
         context += "\n\nRelevant emails found:\n"
         for email in search_results[:10]:
@@ -414,57 +697,32 @@ def ask_question():
     
     # Get additional data context (products, invoices, production runs, etc.)
     related_data = []
-    conn = get_db_connection()
-    cursor = conn.cursor()
     
     # Search products
-    cursor.execute('SELECT * FROM products WHERE name LIKE ? OR description LIKE ? OR notes LIKE ?', 
-                   (f'%{question}%', f'%{question}%', f'%{question}%'))
-    products = cursor.fetchall()
-    for p in products:
+    for p in products_future.result():
         related_data.append({'type': 'product', 'name': p['name'], 'price': p['price'], 'description': p['description']})
         context += f"\nProduct: {p['name']} - €{p['price'] or 0} - {p['description'] or ''}\n"
     
     # Search production runs
-    cursor.execute('SELECT * FROM production_runs WHERE client LIKE ? OR product LIKE ? OR order_ref LIKE ? OR notes LIKE ?',
-                   (f'%{question}%', f'%{question}%', f'%{question}%', f'%{question}%'))
-    runs = cursor.fetchall()
-    for r in runs:
+    for r in runs_future.result():
         related_data.append({'type': 'production', 'title': f"{r['client']} - {r['product']}", 'order_ref': r['order_ref']})
         context += f"\nProduction Run: {r['client']} - {r['product']} - Ref: {r['order_ref']} - Qty: {r['quantity']}\n"
     
     # Search invoices
-    try:
-        cursor.execute('SELECT * FROM invoices WHERE invoice_number LIKE ? OR bill_to LIKE ? OR notes LIKE ?',
-                       (f'%{question}%', f'%{question}%', f'%{question}%'))
-        invoices = cursor.fetchall()
-        for inv in invoices:
-            related_data.append({'type': 'invoice', 'title': inv['invoice_number'], 'total': inv['total']})
-            context += f"\nInvoice: {inv['invoice_number']} - €{inv['total'] or 0} - {inv['bill_to'] or ''}\n"
-    except:
-        pass  # Table may not exist yet
+    for inv in invoices_future.result():
+        related_data.append({'type': 'invoice', 'title': inv['invoice_number'], 'total': inv['total']})
+        context += f"\nInvoice: {inv['invoice_number']} - €{inv['total'] or 0} - {inv['bill_to'] or ''}\n"
     
     # Search proforma invoices
-    try:
-        cursor.execute('SELECT * FROM proforma_invoices WHERE invoice_number LIKE ? OR bill_to LIKE ? OR notes LIKE ?',
-                       (f'%{question}%', f'%{question}%', f'%{question}%'))
-        proformas = cursor.fetchall()
-        for pf in proformas:
-            related_data.append({'type': 'proforma', 'title': pf['invoice_number'], 'total': pf['total']})
-            context += f"\nPro Forma: {pf['invoice_number']} - €{pf['total'] or 0} - {pf['bill_to'] or ''}\n"
-    except:
-        pass  # Table may not exist yet
+    for pf in proformas_future.result():
+        related_data.append({'type': 'proforma', 'title': pf['invoice_number'], 'total': pf['total']})
+        context += f"\nPro Forma: {pf['invoice_number']} - €{pf['total'] or 0} - {pf['bill_to'] or ''}\n"
     
     # Search clients
-    cursor.execute('SELECT * FROM clients WHERE name LIKE ? OR contact_info LIKE ?',
-                   (f'%{question}%', f'%{question}%'))
-    clients = cursor.fetchall()
-    for c in clients:
+    for c in clients_future.result():
         related_data.append({'type': 'client', 'name': c['name']})
         context += f"\nClient: {c['name']} - {c['contact_info'] or ''}\n"
     
-    conn.close()
-    
     # Modify question for Greek response if needed
     if greek_mode:
         question = f"{question}\n\nPlease respond in Greek (Ελληνικά)."
@@ -509,7 +767,8 @@ def get_all_emails():
         ORDER BY e.date_received DESC
     ''')
     
-    emails = [dict(row) for row in cursor.fetchall()]
+    # Rows are already dicts (DictRow / RealDictRow), so serialize them as fetched
+    emails = cursor.fetchall()
     conn.close()
     return jsonify(emails)
 
@@ -519,43 +778,196 @@ def mark_email_read(email_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Check current status
-    cursor.execute('SELECT is_read FROM email_read_status WHERE email_id = ?', (email_id,))
-    row = cursor.fetchone()
-    
-    if row:
-        new_status = 0 if row['is_read'] else 1
-        cursor.execute('UPDATE email_read_status SET is_read = ?, read_at = CURRENT_TIMESTAMP WHERE email_id = ?', 
-                       (new_status, email_id))
-    else:
-        cursor.execute('INSERT INTO email_read_status (email_id, is_read, read_at) VALUES (?, 1, CURRENT_TIMESTAMP)', 
-                       (email_id,))
-        new_status = 1
+    # First toggle inserts as read; later ones flip the stored flag in the same statement
+    cursor.execute('''
+        INSERT INTO email_read_status (email_id, is_read, read_at) VALUES (?, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT(email_id) DO UPDATE SET
+            is_read = CASE WHEN email_read_status.is_read THEN 0 ELSE 1 END,
+            read_at = CURRENT_TIMESTAMP
+        RETURNING is_read
+    ''', (email_id,))
+    new_status = cursor.fetchone()['is_read']
     
     conn.commit()
     conn.close()
     return jsonify({'email_id': email_id, 'is_read': new_status})
 
+@app.route('/api/emails/read', methods=['POST'])
+def mark_emails_read():
+    """Set the read status of many emails at once (body: {"ids": [...], "is_read": 1})."""
+    data = request.get_json() or {}
+    ids = data.get('ids')
+    # bool is an int subclass, so check the exact type or true/false would mean ids 1/0
+    if not isinstance(ids, list) or not ids or not all(type(i) is int for i in ids):
+        return jsonify({'error': 'ids must be a non-empty list of email ids'}), 400
+    is_read = 1 if data.get('is_read', 1) else 0
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # One statement per id, all in a single transaction and commit
+    cursor.executemany('''
+        INSERT INTO email_read_status (email_id, is_read, read_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(email_id) DO UPDATE SET is_read = excluded.is_read, read_at = CURRENT_TIMESTAMP
+    ''', [(email_id, is_read) for email_id in ids])
+    
+    conn.commit()
+    conn.close()
+    return jsonify({'updated': len(ids), 'is_read': is_read})
+
+# Keywords for categorization
+# NOTE: Our only real suppliers are Rotopak IKE and Central Pack (for cardboard boxes)
+# Most other companies are our customers
+ENTITY_CATEGORY_KEYWORDS = {
+    'transport': ['shipping', 'freight', 'cargo', 'transport', 'delivery', 'shipment', 'logistics', 'forwarding', 'customs', 'export', 'import', 'delamode', 'gava', 'dimensions', 'cargologistix'],
+    'taxation': ['tax', 'vat', 'payment', 'accounting', 'fiscal', 'smarttax', 'bank'],
+    'legal': ['lawyer', 'legal', 'contract', 'patent', 'agreement', 'law'],
+    'suppliers': ['rotopak', 'central pack', 'centralpack'],
+    'customers': ['order', 'purchase', 'buy', 'customer', 'jtape', 'dtc', 'baxt', 'bodyshop', 'bellini', 'bolest', 'orbit', 'streem', 'gyso', 'amba', 'rohel']
+}
+
+# Known domain categorizations
+# NOTE: Rotopak IKE and Central Pack are our only real suppliers
+KNOWN_DOMAIN_CATEGORIES = {
+    'delamode-group.com': 'transport',
+    'gavagroup.com': 'transport',
+    'dimensions-forwarding.com': 'transport',
+    'cargologistix-forwarding.ro': 'transport',
+    'mtrading.ro': 'transport',
+    'hartrodt.com': 'transport',
+    'klgeurope.com': 'transport',
+    'geis-group.de': 'transport',
+    'orbit-streem.com': 'customers',
+    'rohel.ro': 'customers',
+    'gyso.ch': 'customers',
+    'smarttax.ro': 'taxation',
+    'librabank.ro': 'taxation',
+    'customs.ro': 'taxation',
+    'jtape.com': 'customers',
+    'dtc-uk.com': 'customers',
+    'baxt-products.com': 'customers',
+    'bodyshopaustralia.com.au': 'customers',
+    'bellinisystems.it': 'customers',
+    'bolest.se': 'customers',
+    'amba.co.uk': 'customers',
+    'rotopak.gr': 'suppliers',
+    'centralpack.gr': 'suppliers',
+    'ntova.gr': 'legal',
+    'dfwprofessional.eu': 'internal'
+}
+
+KEYWORD_CATEGORY = {kw: cat for cat, kws in ENTITY_CATEGORY_KEYWORDS.items() for kw in kws}
+# Lookahead so every start position is tried, like the per-keyword `in` checks
+CATEGORY_KEYWORD_RE = re.compile(
+    '(?=(' + '|'.join(map(re.escape, sorted(KEYWORD_CATEGORY, key=len, reverse=True))) + '))'
+)
+
+def keyword_category(text, domain):
+    """First ENTITY_CATEGORY_KEYWORDS category with a keyword in text or domain, else 'other'."""
+    found = {KEYWORD_CATEGORY[kw] for kw in CATEGORY_KEYWORD_RE.findall(text)}
+    found.update(KEYWORD_CATEGORY[kw] for kw in CATEGORY_KEYWORD_RE.findall(domain))
+    for cat in ENTITY_CATEGORY_KEYWORDS:
+        if cat in found:
+            return cat
+    return 'other'
+
+@lru_cache(maxsize=4096)
+def known_domain_category(domain):
+    """Return the KNOWN_DOMAIN_CATEGORIES category whose domain appears in domain, or None."""
+    # No known domain contains another, so an exact hit is the same answer the scan would give
+    category = KNOWN_DOMAIN_CATEGORIES.get(domain)
+    if category is not None:
+        return category
+    for dom, cat in KNOWN_DOMAIN_CATEGORIES.items():
+        if dom in domain:
+            return cat
+    return None
+
+# Same parsing as parse_sender, but senders without an address are skipped rather than kept raw
+@lru_cache(maxsize=8192)
+def parse_relationship_sender(from_addr):
+    """Return (address, display name, domain) for a raw From header, or None if it should be skipped."""
+    email_match = EMAIL_ANGLE_RE.search(from_addr)
+    if email_match:
+        addr = email_match.group(1).lower()
+    else:
+        addr_match = EMAIL_BARE_RE.search(from_addr)
+        addr = addr_match.group(0).lower() if addr_match else ''
+    
+    if not addr or SKIP_SENDER_RE.search(addr):
+        return None
+    
+    domain = addr.split('@')[-1] if '@' in addr else ''
+    name_match = NAME_RE.match(from_addr)
+    name = name_match.group(1).strip().strip('"') if name_match else addr.split('@')[0]
+    return addr, name, domain
+
+def add_relationship_contact(bucket, addr, name, domain, count, first_contact, last_contact):
+    """Merge count and contact dates for addr into a category bucket."""
+    entity = bucket.get(addr)
+    if entity is None:
+        bucket[addr] = {
+            'email': addr,
+            'name': name,
+            'domain': domain,
+            'email_count': count,
+            'first_contact': first_contact,
+            'last_contact': last_contact
+        }
+        return
+    
+    entity['email_count'] += count
+    if first_contact and (not entity['first_contact'] or first_contact < entity['first_contact']):
+        entity['first_contact'] = first_contact
+    if last_contact and (not entity['last_contact'] or last_contact > entity['last_contact']):
+        entity['last_contact'] = last_contact
+
+# Last get_entity_relationships payload, keyed on emails freshness and the trigger-bumped
+# entity_categories counter (shared by every worker, unlike an in-process reset)
+relationships_cache = {'version': None, 'json': None}
+relationships_cache_lock = threading.Lock()
+
 @app.route('/api/entity-relationships')
 def get_entity_relationships():
     """Get entities categorized by their relationship to the company."""
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute('''
+        SELECT (SELECT COUNT(*) FROM emails) as email_total,
+               (SELECT MAX(id) FROM emails) as max_email_id,
+               (SELECT value FROM app_settings WHERE key = ?) as categories_version
+    ''', (ENTITY_CATEGORIES_VERSION_SETTING,))
+    row = cursor.fetchone()
+    conn.close()
+    version = (row['email_total'], row['max_email_id'], row['categories_version'])
+    
+    with relationships_cache_lock:
+        if relationships_cache['version'] != version:
+            relationships_cache['json'] = app.json.dumps(compute_entity_relationships()).encode('utf-8')
+            relationships_cache['version'] = version
+        return Response(relationships_cache['json'], mimetype='application/json')
+
+def compute_entity_relationships():
+    """Categorize every sender; see get_entity_relationships for caching."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
     
+    # Per-sender totals come from SQLite; only senders that need the keyword
+    # fallback are scanned email by email below
     cursor.execute('''
-        SELECT id, subject, from_address, to_address, body_text, date_received
+        SELECT from_address, COUNT(*) as email_count,
+               MIN(date_received) as first_contact, MAX(date_received) as last_contact
         FROM emails 
-        ORDER BY date_received DESC
+        GROUP BY from_address
+        ORDER BY last_contact DESC
     ''')
     
-    emails = cursor.fetchall()
+    senders = cursor.fetchall()
     
     # Load user-defined category overrides
     cursor.execute('SELECT domain, category FROM entity_categories')
     category_overrides = {row['domain']: row['category'] for row in cursor.fetchall()}
     
-    conn.close()
-    
     # Categorize entities based on email content and domain
     categories = {
         'customers': {},
@@ -567,120 +979,91 @@ def get_entity_relationships():
         'other': {}
     }
     
-    # Keywords for categorization
-    # NOTE: Our only real suppliers are Rotopak IKE and Central Pack (for cardboard boxes)
-    # Most other companies are our customers
-    category_keywords = {
-        'transport': ['shipping', 'freight', 'cargo', 'transport', 'delivery', 'shipment', 'logistics', 'forwarding', 'customs', 'export', 'import', 'delamode', 'gava', 'dimensions', 'cargologistix'],
-        'taxation': ['tax', 'vat', 'payment', 'accounting', 'fiscal', 'smarttax', 'bank'],
-        'legal': ['lawyer', 'legal', 'contract', 'patent', 'agreement', 'law'],
-        'suppliers': ['rotopak', 'central pack', 'centralpack'],
-        'customers': ['order', 'purchase', 'buy', 'customer', 'jtape', 'dtc', 'baxt', 'bodyshop', 'bellini', 'bolest', 'orbit', 'streem', 'gyso', 'amba', 'rohel']
-    }
+    # Raw from_address -> (addr, name, domain) for senders categorized by keywords
+    keyword_senders = {}
     
-    # Known domain categorizations
-    # NOTE: Rotopak IKE and Central Pack are our only real suppliers
-    domain_categories = {
-        'delamode-group.com': 'transport',
-        'gavagroup.com': 'transport',
-        'dimensions-forwarding.com': 'transport',
-        'cargologistix-forwarding.ro': 'transport',
-        'mtrading.ro': 'transport',
-        'hartrodt.com': 'transport',
-        'klgeurope.com': 'transport',
-        'geis-group.de': 'transport',
-        'orbit-streem.com': 'customers',
-        'rohel.ro': 'customers',
-        'gyso.ch': 'customers',
-        'smarttax.ro': 'taxation',
-        'librabank.ro': 'taxation',
-        'customs.ro': 'taxation',
-        'jtape.com': 'customers',
-        'dtc-uk.com': 'customers',
-        'baxt-products.com': 'customers',
-        'bodyshopaustralia.com.au': 'customers',
-        'bellinisystems.it': 'customers',
-        'bolest.se': 'customers',
-        'amba.co.uk': 'customers',
-        'rotopak.gr': 'suppliers',
-        'centralpack.gr': 'suppliers',
-        'ntova.gr': 'legal',
-        'dfwprofessional.eu': 'internal'
-    }
-    
-    for email in emails:
-        from_addr = email['from_address'] or ''
-        body = (email['body_text'] or '').lower()
-        subject = (email['subject'] or '').lower()
-        text = f"{subject} {body}"
-        
-        # Extract email
-        email_match = re.search(r'<([^>]+@[^>]+)>', from_addr)
-        if email_match:
-            addr = email_match.group(1).lower()
-        else:
-            addr_match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', from_addr)
-            addr = addr_match.group(0).lower() if addr_match else ''
-        
-        if not addr or any(x in addr for x in ['mailer-daemon', 'noreply', 'no-reply', 'accounts.google']):
+    for sender in senders:
+        from_addr = sender['from_address'] or ''
+        parsed = parse_relationship_sender(from_addr)
+        if parsed is None:
             continue
+        addr, name, domain = parsed
         
-        domain = addr.split('@')[-1] if '@' in addr else ''
-        
-        # Extract name
-        name_match = re.match(r'^([^<]+)', from_addr)
-        name = name_match.group(1).strip().strip('"') if name_match else addr.split('@')[0]
-        
-        # Determine category
-        category = 'other'
+        # User overrides first, then default domain categories
+        category = category_overrides.get(domain)
+        if category is None:
+            category = known_domain_category(domain)
         
-        # First check user overrides
-        if domain in category_overrides:
-            category = category_overrides[domain]
+        if category is None:
+            keyword_senders[from_addr] = (addr, name, domain)
         else:
-            # Then check default domain categories
-            for dom, cat in domain_categories.items():
-                if dom in domain:
-                    category = cat
-                    break
+            add_relationship_contact(categories[category], addr, name, domain, sender['email_count'],
+                                     sender['first_contact'], sender['last_contact'])
+    
+    if keyword_senders:
+        # Only those senders' emails leave SQLite; the list goes over as one JSON parameter
+        cursor.execute('''
+            SELECT from_address, subject, body_text, date_received
+            FROM emails 
+            WHERE COALESCE(from_address, '') IN (SELECT value FROM json_each(?))
+            ORDER BY date_received DESC
+        ''', (json.dumps(list(keyword_senders)),))
+        
+        # (category, addr) -> (name, domain, dates), merged into the buckets once per key
+        contact_dates = {}
+        for email in cursor:
+            addr, name, domain = keyword_senders[email['from_address'] or '']
             
-            # If still other, check keywords
-            if category == 'other':
-                for cat, keywords in category_keywords.items():
-                    if any(kw in text or kw in domain for kw in keywords):
-                        category = cat
-                        break
-        
-        # Add to category
-        if addr not in categories[category]:
-            categories[category][addr] = {
-                'email': addr,
-                'name': name,
-                'domain': domain,
-                'email_count': 0,
-                'first_contact': email['date_received'],
-                'last_contact': email['date_received']
-            }
+            body = (email['body_text'] or '').lower()
+            subject = (email['subject'] or '').lower()
+            text = f"{subject} {body}"
+            
+            # Domain unknown, so check keywords in this email
+            category = keyword_category(text, domain)
+            
+            entry = contact_dates.get((category, addr))
+            if entry is None:
+                contact_dates[(category, addr)] = (name, domain, [email['date_received']])
+            else:
+                entry[2].append(email['date_received'])
         
-        categories[category][addr]['email_count'] += 1
-        if email['date_received']:
-            if email['date_received'] < categories[category][addr]['first_contact']:
-                categories[category][addr]['first_contact'] = email['date_received']
-            if email['date_received'] > categories[category][addr]['last_contact']:
-                categories[category][addr]['last_contact'] = email['date_received']
+        for (category, addr), (name, domain, dates) in contact_dates.items():
+            known = [d for d in dates if d]
+            add_relationship_contact(categories[category], addr, name, domain, len(dates),
+                                     min(known) if known else dates[0], max(known) if known else dates[0])
+    
+    conn.close()
     
     # Convert to list format
     result = {}
     for cat, entities in categories.items():
         result[cat] = sorted(entities.values(), key=lambda x: x['email_count'], reverse=True)
     
-    return jsonify(result)
+    return result
+
+# Columns /api/email/<id>?fields= may select; 'headers' expands to EMAIL_HEADER_FIELDS
+EMAIL_HEADER_FIELDS = ('id', 'message_id', 'subject', 'from_address', 'to_address', 'date_received')
+EMAIL_FIELDS = frozenset(EMAIL_HEADER_FIELDS + ('body_text', 'body_html', 'headers', 'created_at'))
 
 @app.route('/api/email/<int:email_id>')
 def get_email(email_id):
+    # Without ?fields= every column is returned, including the body_html/headers blobs
+    columns = '*'
+    fields = request.args.get('fields')
+    if fields:
+        selected = []
+        for field in fields.split(','):
+            field = field.strip()
+            for column in (EMAIL_HEADER_FIELDS if field == 'headers' else (field,)):
+                if column not in EMAIL_FIELDS:
+                    return jsonify({'error': f'Unknown field: {column}'}), 400
+                if column not in selected:
+                    selected.append(column)
+        columns = ', '.join(selected)
+    
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM emails WHERE id = ?', (email_id,))
+    cursor.execute(f'SELECT {columns} FROM emails WHERE id = ?', (email_id,))
     email = cursor.fetchone()
     conn.close()
     
@@ -706,7 +1089,7 @@ def get_stats():
         ORDER BY count DESC 
         LIMIT 10
     ''')
-    top_senders = [dict(row) for row in cursor.fetchall()]
+    top_senders = cursor.fetchall()
     
     conn.close()
     
@@ -716,6 +1099,401 @@ def get_stats():
         'top_senders': top_senders
     })
 
+# Fixed RON→EUR rate the invoice tabs convert with (matches the UI's EUR_TO_RON)
+RON_PER_EUR = 4.97
+
+# Invoice-route patterns, compiled once at import
+INVOICE_SUBJECT_NO_RE = re.compile(r'(?:invoice|factura|inv)[#:\s]*([A-Z0-9\-/]+)', re.IGNORECASE)
+EMAIL_AMOUNT_RE = re.compile(r'[€$]?\s*([\d,]+\.?\d*)\s*(?:EUR|RON|€)?')
+DIGITS_RE = re.compile(r'(\d+)')
+INVOICE_PROFORMA_NO_RE = re.compile(r'(?:INVOICE|PROFORMA)\s*N[oOοº°]?\.?\s*:?\s*(\d+)', re.IGNORECASE)
+
+# Kept as separate patterns rather than one alternation: callers take the first
+# pattern that matches anywhere, while an alternation returns the leftmost match
+# (and the lazy FACTURA pattern can swallow a later "INVOICE No")
+DFW_INVOICE_NO_RE = re.compile(r'INVOICE\s*N[oOοº°]\.?\s*:?\s*(\d+)', re.IGNORECASE)
+DFW_FILENAME_NO_RE = re.compile(r'[Ii]nvoice\s*[Nn][oOοº°]?\s*(\d+)')
+DFW_FACTURA_NO_RE = re.compile(r'FACTURA\s+(?:FISCALĂ|SERIA)?\s*[\w\s]*?[:\s]*([A-Z]?\d+)', re.IGNORECASE)
+DFW_AMOUNT_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    # INVOICE format patterns
+    r'TOTAL\s*EUR\s*€?([\d,\.]+)',
+    r'TOTAL\s*:?\s*€?([\d,\.]+)',
+    r'AMOUNT\s*:?\s*€?([\d,\.]+)',
+    # FACTURA format patterns (Romanian)
+    r'TOTAL\s*DE\s*PLATĂ\s*:?\s*€?([\d,\.]+)',
+    r'TOTAL\s*FACTURĂ\s*:?\s*€?([\d,\.]+)',
+    r'TOTAL\s*GENERAL\s*:?\s*€?([\d,\.]+)',
+    r'DE\s*PLATĂ\s*:?\s*€?([\d,\.]+)',
+)]
+DFW_DATE_RE = re.compile(r'Date\s*:?\s*(\d{1,2}[/\.-]\d{1,2}[/\.-]\d{2,4})', re.IGNORECASE)
+DFW_CUSTOMER_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'(JTAPE\s+Limited)',
+    r'(Amba\s+Group\s+Ltd)',
+    r'(DTC\s+[A-Za-z\s]+Ltd)',
+    r'(Bellini[^\n]{0,30})',
+    r'(Bodyshop[^\n]{0,30})',
+    r'(BAXT[^\n]{0,30})',
+)]
+
+JTAPE_PO_RE = re.compile(r'\b(J\d{4,6})\b')
+JTAPE_TOTAL_RE = re.compile(r'Total\s*[€£]?\s*:?\s*([\d.,]+)', re.IGNORECASE)
+JTAPE_DATE_RE = re.compile(r'(?:Date|Order Date)\s*:?\s*(\d{1,2}[/\.]\d{1,2}[/\.]\d{2,4})')
+
+AMBA_PO_NO_RE = re.compile(r'PO\s*NO\s*([A-Z]?[-\d]+\w*)', re.IGNORECASE)
+AMBA_ORDER_NO_RE = re.compile(r'Order\s*No\.?\s*(\d{6,})', re.IGNORECASE)
+AMBA_TOTAL_RE = re.compile(r'TOTAL\s*(?:EUR)?\s*€?([\d,\.]+)', re.IGNORECASE)
+# Document types the invoice tabs leave out, one alternation per tab
+DFW_EXCLUSION_RE = re.compile('|'.join(map(re.escape, (
+    'PROFORMA',           # Proforma invoices
+    'PRO-FORMA',
+    'PRO FORMA',
+    'ORDIN DE PLATA',     # Payment orders
+    'ROHEL TRANS',        # Transport company invoices (even if FACTURA)
+    'ROTO BOP',           # Shipping documents
+    'INTERNATIONAL TRANS',
+    'CONTRACT DE TRANSPORT',
+    'PACKING LIST',
+    'DELIVERY NOTE',
+    'BILL OF LADING',
+    'PAYMENT_',           # Payment confirmations
+    'TRANSACTION_',
+    'BONIFICO',           # Bank transfers
+))))
+JTAPE_EXCLUSION_RE = re.compile('|'.join(map(re.escape, (
+    'packing list', 'rohel trans', 'cmr', 'fedex', 'dhl'
+))))
+AMBA_EXCLUSION_RE = re.compile('|'.join(map(re.escape, (
+    'packing list', 'rohel trans', 'cmr', 'fedex', 'dhl', 'dtc5',  # DTC5xxxx are design files
+    'cds import', 'transaction confirmation'
+))))
+
+AMBA_DATE_RE = re.compile(r'(?:Date|Purchase Order Date)\s*:?\s*(\d{1,2}[\s/\.]\w+[\s/\.]\d{2,4})')
+
+SUPPLIER_TIM_NO_RE = re.compile(r'(ΤΙΜ\d+)')
+SUPPLIER_DA_NO_RE = re.compile(r'(ΔΑ\d+)')
+SUPPLIER_NUMBER_RE = re.compile(r'Νούμερο[^\d]*(\d+)')
+SUPPLIER_NET_VALUE_RE = re.compile(r'Καθαρή Αξία:\s*([\d.,]+)\s*€?')
+SUPPLIER_TOTAL_RE = re.compile(r'Σύνολο[^\d]*([\d.,]+)')
+SUPPLIER_VALUE_RE = re.compile(r'Αξία \(€\)[^\d]*([\d.,]+)')
+
+# Invoice-number fallbacks tried in this order (raw_text first, then filename);
+# separate for the same first-match-wins reason as the DFW patterns above
+CONTRAST_NR_FACTURA_RE = re.compile(r'Nr\.?\s*Factur[ia]+\s*:?\s*(\d+)', re.IGNORECASE)
+CONTRAST_SERIA_NR_RE = re.compile(r'Seria\s+\w+\s+nr:?\s*(\d+)', re.IGNORECASE)
+CONTRAST_OSR_RE = re.compile(r'OSR[_-]?(\d+)', re.IGNORECASE)
+CONTRAST_FACTURA_NR_RE = re.compile(r'Factura[_-]nr[_-]?(\w+)', re.IGNORECASE)
+CONTRAST_FACTURA_RE = re.compile(r'factura[_-]?(\d+)', re.IGNORECASE)
+CONTRAST_DATE_RE = re.compile(r'Data\s*\([^)]+\)\s*:?\s*(\d{1,2}[\./-]\d{1,2}[\./-]\d{2,4})')
+CONTRAST_TOTAL_RE = re.compile(r'Total\s*(?:de plat[aă])?\s*:?\s*([\d\.,]+)', re.IGNORECASE)
+
+PROFORMA_NO_RE = re.compile(r'(?:PROFORMA|PRO\s*FORMA)\s*(?:INVOICE\s*)?N[oOοº°]?\.?\s*:?\s*(\d+)', re.IGNORECASE)
+PROFORMA_FILENAME_NO_RE = re.compile(r'Proforma\s*No\s*(\d+)', re.IGNORECASE)
+PROFORMA_TOTAL_RE = re.compile(r'Total\s*(?:EUR|€)?\s*:?\s*€?\s*([\d.,]+)', re.IGNORECASE)
+
+def extract_dfw_fields(raw_text, filename):
+    """Return (invoice_number, amount, invoice_date, recipient) from a DFW invoice, or None to skip it."""
+    raw_upper = raw_text.upper()
+    
+    # EXCLUSION PATTERNS - skip these document types (see DFW_EXCLUSION_RE)
+    if DFW_EXCLUSION_RE.search(raw_upper) or DFW_EXCLUSION_RE.search(filename.upper()):
+        return None
+    
+    # MUST have DFW PROFESSIONAL SRL as issuer (LIKE in the query is case-insensitive;
+    # re-checked here for non-ASCII case folding)
+    if 'DFW PROFESSIONAL' not in raw_upper:
+        return None
+    
+    # Try to match either INVOICE or FACTURA format
+    invoice_number = None
+    
+    # Pattern 1: "INVOICE No 63" format
+    invoice_match = DFW_INVOICE_NO_RE.search(raw_text)
+    if invoice_match:
+        invoice_number = int(invoice_match.group(1))
+    else:
+        # Check filename for invoice number
+        filename_match = DFW_FILENAME_NO_RE.search(filename)
+        if filename_match:
+            invoice_number = int(filename_match.group(1))
+    
+    # Pattern 2: "FACTURA" with DFW format (look for invoice number)
+    if not invoice_number and 'FACTURA' in raw_upper:
+        # Try to extract factura number from text or filename
+        factura_match = DFW_FACTURA_NO_RE.search(raw_text)
+        if factura_match:
+            num_str = factura_match.group(1)
+            # Extract just the digits
+            digit_match = DIGITS_RE.search(num_str)
+            if digit_match:
+                invoice_number = int(digit_match.group(1))
+    
+    # Must be in range 1-90
+    if not invoice_number or invoice_number < 1 or invoice_number > 90:
+        return None
+    
+    # Try various patterns for amount extraction
+    amount = None
+    for pattern in DFW_AMOUNT_PATTERNS:
+        total_match = pattern.search(raw_text)
+        if total_match:
+            try:
+                amount_str = total_match.group(1).replace(',', '')
+                # Handle European number format: 1.234,56 -> 1234.56
+                if '.' in amount_str and amount_str.count('.') > 1:
+                    amount_str = amount_str.replace('.', '')
+                amount = float(amount_str)
+                break
+            except:
+                pass
+    
+    date_match = DFW_DATE_RE.search(raw_text)
+    invoice_date = date_match.group(1) if date_match else ''
+    
+    # Extract recipient/customer
+    recipient = ''
+    for pattern in DFW_CUSTOMER_PATTERNS:
+        match = pattern.search(raw_text)
+        if match:
+            recipient = match.group(1).strip()[:40]
+            break
+    
+    return invoice_number, amount, invoice_date, recipient
+
+def classify_dfw_invoices(conn, cursor):
+    """Store extract_dfw_fields results in the dfw_* columns of parsed_invoices rows not yet classified."""
+    cursor.execute('SELECT 1 FROM parsed_invoices WHERE is_dfw IS NULL LIMIT 1')
+    if cursor.fetchone() is None:
+        return
+    
+    # Rows without the issuer can't be DFW invoices, so settle those without leaving SQLite
+    cursor.execute('''
+        UPDATE parsed_invoices SET is_dfw = 0
+        WHERE is_dfw IS NULL AND COALESCE(raw_text, '') NOT LIKE '%DFW PROFESSIONAL%'
+    ''')
+    cursor.execute('''
+        SELECT pi.id, pi.raw_text, a.filename
+        FROM parsed_invoices pi
+        LEFT JOIN attachments a ON pi.attachment_id = a.id
+        WHERE pi.is_dfw IS NULL
+    ''')
+    updates = []
+    for row in cursor:
+        fields = extract_dfw_fields(row['raw_text'] or '', row['filename'] or '')
+        if fields is None:
+            updates.append((0, None, None, None, None, row['id']))
+        else:
+            updates.append((1, *fields, row['id']))
+    
+    cursor.executemany('''
+        UPDATE parsed_invoices
+        SET is_dfw = ?, dfw_invoice_number = ?, dfw_amount = ?, dfw_date = ?, dfw_recipient = ?
+        WHERE id = ?
+    ''', updates)
+    conn.commit()
+
+def extract_jtape_fields(raw_text, filename):
+    """Return (doc_number, doc_type, amount, order_date) from a JTAPE document, or None to skip it."""
+    raw_upper = raw_text.upper()
+    filename_lower = filename.lower()
+    
+    # Skip excluded documents
+    combined = (raw_text + ' ' + filename).lower()
+    if JTAPE_EXCLUSION_RE.search(combined):
+        return None
+    
+    # Must have JTAPE reference in text or filename (pre-filtered by LIKE in the query;
+    # re-checked here for non-ASCII case folding)
+    has_jtape = 'JTAPE' in raw_upper or 'J-TAPE' in raw_upper or 'jtape' in filename_lower or 'j-tape' in filename_lower
+    if not has_jtape:
+        return None
+    
+    # Extract document number - try PO #, Invoice No, Proforma No
+    doc_number = None
+    # PO format like J9851
+    po_match = JTAPE_PO_RE.search(raw_text + ' ' + filename)
+    if po_match:
+        doc_number = po_match.group(1)
+    else:
+        # Invoice No format
+        inv_match = INVOICE_PROFORMA_NO_RE.search(raw_text)
+        if inv_match:
+            doc_number = inv_match.group(1)
+        else:
+            # Extract number from filename
+            fn_match = DIGITS_RE.search(filename)
+            doc_number = fn_match.group(1) if fn_match else 'N/A'
+    
+    # Determine document type
+    doc_type = 'Invoice'
+    if 'PROFORMA' in raw_upper or 'proforma' in filename_lower:
+        doc_type = 'Proforma'
+    elif 'PURCHASE ORDER' in raw_upper or 'PO' in filename.upper():
+        doc_type = 'PO'
+    
+    # Extract amount (European format)
+    amount = None
+    total_match = JTAPE_TOTAL_RE.search(raw_text)
+    if total_match:
+        try:
+            amt_str = total_match.group(1)
+            if ',' in amt_str:
+                amt_str = amt_str.replace('.', '').replace(',', '.')
+            amount = float(amt_str)
+        except:
+            pass
+    
+    # Extract date
+    date_match = JTAPE_DATE_RE.search(raw_text)
+    order_date = date_match.group(1) if date_match else None
+    
+    return doc_number, doc_type, amount, order_date
+
+def extract_amba_fields(raw_text, filename):
+    """Return (doc_number, doc_type, amount, order_date, customer) from an Amba/BAXT document, or None to skip it."""
+    raw_upper = raw_text.upper()
+    filename_lower = filename.lower()
+    
+    # Skip excluded documents
+    combined = (raw_text + ' ' + filename).lower()
+    if AMBA_EXCLUSION_RE.search(combined):
+        return None
+    
+    # Must have Amba or BAXT reference (pre-filtered by LIKE in the query)
+    has_amba = 'AMBA' in raw_upper or 'amba' in filename_lower
+    has_baxt = 'BAXT' in raw_upper or 'baxt' in filename_lower
+    
+    if not (has_amba or has_baxt):
+        return None
+    
+    # Extract document number - try PO #, Invoice No, Proforma No
+    doc_number = None
+    
+    # PO format
+    po_match = AMBA_PO_NO_RE.search(raw_text)
+    if po_match:
+        doc_number = po_match.group(1)
+    else:
+        po_match = AMBA_ORDER_NO_RE.search(raw_text)
+        if po_match:
+            doc_number = po_match.group(1)
+    
+    if not doc_number:
+        # Invoice/Proforma No format
+        inv_match = INVOICE_PROFORMA_NO_RE.search(raw_text)
+        if inv_match:
+            doc_number = inv_match.group(1)
+        else:
+            # Extract number from filename
+            fn_match = DIGITS_RE.search(filename)
+            doc_number = fn_match.group(1) if fn_match else 'N/A'
+    
+    # Extract amount
+    amount = None
+    total_match = AMBA_TOTAL_RE.search(raw_text)
+    if total_match:
+        try:
+            amount = float(total_match.group(1).replace(',', ''))
+        except:
+            pass
+    
+    # Determine document type
+    doc_type = 'Invoice'
+    if 'PROFORMA' in raw_upper or 'proforma' in filename_lower:
+        doc_type = 'Proforma'
+    elif 'PURCHASE ORDER' in raw_upper or 'PO' in filename.upper():
+        doc_type = 'PO'
+    
+    # Extract date
+    date_match = AMBA_DATE_RE.search(raw_text)
+    order_date = date_match.group(1) if date_match else None
+    
+    customer = 'BAXT' if has_baxt else 'Amba Group'
+    
+    return doc_number, doc_type, amount, order_date, customer
+
+
+# JTAPE/Amba candidate rows with their extracted fields, shared by both tabs and
+# reloaded whenever the parsed_invoices version counter moves
+invoice_catalog = {'version': None, 'rows': None}
+invoice_catalog_lock = threading.Lock()
+
+def append_assigned_invoices(invoices, assigned_rows, convert_ron, **labels):
+    """Append the manually assigned rows a tab's own matching didn't already list.
+    
+    convert_ron reports RON amounts in EUR; labels fill the tab's extra columns.
+    """
+    seen_ids = set(inv['id'] for inv in invoices)
+    for row in assigned_rows:
+        if row['id'] in seen_ids:
+            continue
+        amount = row['amount']
+        currency = row['currency'] or 'EUR'
+        if convert_ron:
+            if currency == 'RON' and amount:
+                amount = amount / RON_PER_EUR
+            currency = 'EUR'
+        invoices.append({
+            'id': row['id'], 'attachment_id': row['attachment_id'],
+            'invoice_number': row['invoice_number'] or row['filename'][:15],
+            'invoice_date': row['invoice_date'] or '',
+            'email_date': row['date_received'][:10] if row['date_received'] else '',
+            'amount': amount, 'currency': currency,
+            'filename': row['filename'], 'manually_assigned': True,
+            **labels
+        })
+
+def get_invoice_catalog(cursor):
+    """Return [(row, jtape_fields, amba_fields)] for JTAPE/Amba documents, newest email first."""
+    cursor.execute('SELECT value FROM app_settings WHERE key = ?', (PARSED_INVOICES_VERSION_SETTING,))
+    version_row = cursor.fetchone()
+    version = version_row['value'] if version_row else None
+    
+    with invoice_catalog_lock:
+        if version is not None and invoice_catalog['version'] == version:
+            return invoice_catalog['rows']
+        
+        # One scan for both tabs; raw_text is dropped once the fields are extracted
+        cursor.execute('''
+            SELECT 
+                pi.id,
+                pi.invoice_number,
+                pi.invoice_date,
+                pi.amount,
+                pi.currency,
+                pi.raw_text,
+                pi.assigned_tab,
+                pi.hidden,
+                a.filename,
+                a.file_path,
+                a.id as attachment_id,
+                e.id as email_id,
+                e.date_received,
+                e.from_address,
+                e.subject
+            FROM parsed_invoices pi
+            JOIN attachments a ON pi.attachment_id = a.id
+            JOIN emails e ON pi.email_id = e.id
+            WHERE pi.raw_text LIKE '%JTAPE%' OR pi.raw_text LIKE '%J-TAPE%'
+               OR a.filename LIKE '%JTAPE%' OR a.filename LIKE '%J-TAPE%'
+               OR pi.raw_text LIKE '%AMBA%' OR pi.raw_text LIKE '%BAXT%'
+               OR a.filename LIKE '%AMBA%' OR a.filename LIKE '%BAXT%'
+               OR pi.assigned_tab IN ('jtape', 'amba')
+            ORDER BY e.date_received DESC
+        ''')
+        
+        rows = []
+        for row in cursor:
+            raw_text = row.pop('raw_text') or ''
+            filename = row['filename'] or ''
+            jtape_fields = extract_jtape_fields(raw_text, filename)
+            amba_fields = extract_amba_fields(raw_text, filename)
+            if jtape_fields is not None or amba_fields is not None or row['assigned_tab'] in ('jtape', 'amba'):
+                rows.append((row, jtape_fields, amba_fields))
+        
+        invoice_catalog['version'] = version
+        invoice_catalog['rows'] = rows
+        return rows
+
 @app.route('/api/invoices')
 def get_invoices():
     """Get all parsed invoices from PDF attachments."""
@@ -748,7 +1526,7 @@ def get_invoices():
     for row in cursor.fetchall():
         from_addr = row['from_address'] or ''
         # Extract sender name
-        name_match = re.match(r'^([^<]+)', from_addr)
+        name_match = NAME_RE.match(from_addr)
         sender = name_match.group(1).strip().strip('"') if name_match else from_addr.split('@')[0] if '@' in from_addr else from_addr
         
         parsed_invoices.append({
@@ -781,18 +1559,18 @@ def get_invoices():
     email_invoices = []
     for row in cursor.fetchall():
         from_addr = row['from_address'] or ''
-        name_match = re.match(r'^([^<]+)', from_addr)
+        name_match = NAME_RE.match(from_addr)
         sender = name_match.group(1).strip().strip('"') if name_match else from_addr.split('@')[0] if '@' in from_addr else from_addr
         
         # Try to extract invoice number from subject
-        inv_match = re.search(r'(?:invoice|factura|inv)[#:\s]*([A-Z0-9\-/]+)', row['subject'] or '', re.IGNORECASE)
+        inv_match = INVOICE_SUBJECT_NO_RE.search(row['subject'] or '')
         inv_number = inv_match.group(1) if inv_match else 'N/A'
         
         # Try to extract amount
         amount = None
         currency = 'EUR'
         text = (row['subject'] or '') + ' ' + (row['body_text'] or '')
-        amt_match = re.search(r'[€$]?\s*([\d,]+\.?\d*)\s*(?:EUR|RON|€)?', text)
+        amt_match = EMAIL_AMOUNT_RE.search(text)
         if amt_match:
             try:
                 amount = float(amt_match.group(1).replace(',', ''))
@@ -850,6 +1628,9 @@ def get_dfw_invoices():
     conn = get_db_connection()
     cursor = conn.cursor()
     
+    # The regex work runs once per new or re-parsed row; the listing itself never reads raw_text
+    classify_dfw_invoices(conn, cursor)
+    
     cursor.execute('''
         SELECT 
             pi.id,
@@ -857,7 +1638,12 @@ def get_dfw_invoices():
             pi.invoice_date,
             pi.amount,
             pi.currency,
-            pi.raw_text,
+            pi.dfw_invoice_number,
+            pi.dfw_amount,
+            pi.dfw_date,
+            pi.dfw_recipient,
+            pi.is_dfw,
+            CASE WHEN pi.assigned_tab = 'dfw' AND (pi.hidden IS NULL OR pi.hidden = 0) THEN 1 ELSE 0 END as manually_assigned,
             a.filename,
             a.file_path,
             a.id as attachment_id,
@@ -869,137 +1655,43 @@ def get_dfw_invoices():
         FROM parsed_invoices pi
         JOIN attachments a ON pi.attachment_id = a.id
         JOIN emails e ON pi.email_id = e.id
+        WHERE pi.is_dfw = 1 OR (pi.assigned_tab = 'dfw' AND (pi.hidden IS NULL OR pi.hidden = 0))
         ORDER BY pi.invoice_number ASC
     ''')
     
     dfw_invoices = []
     seen_invoice_numbers = set()
+    assigned_rows = []
     
-    for row in cursor.fetchall():
-        raw_text = row['raw_text'] or ''
-        raw_upper = raw_text.upper()
-        filename_upper = (row['filename'] or '').upper()
-        
-        # EXCLUSION PATTERNS - skip these document types:
-        exclusion_keywords = [
-            'PROFORMA',           # Proforma invoices
-            'PRO-FORMA',
-            'PRO FORMA',
-            'ORDIN DE PLATA',     # Payment orders
-            'ROHEL TRANS',        # Transport company invoices (even if FACTURA)
-            'ROTO BOP',           # Shipping documents
-            'INTERNATIONAL TRANS',
-            'CONTRACT DE TRANSPORT',
-            'PACKING LIST',
-            'DELIVERY NOTE',
-            'BILL OF LADING',
-            'PAYMENT_',           # Payment confirmations
-            'TRANSACTION_',
-            'BONIFICO',           # Bank transfers
-        ]
-        
-        is_excluded = any(kw in raw_upper or kw in filename_upper for kw in exclusion_keywords)
-        if is_excluded:
+    for row in cursor:
+        # Manually assigned rows come back in the same query; they are added after the matches
+        if row['manually_assigned']:
+            assigned_rows.append(row)
+        if row['is_dfw'] != 1:
             continue
         
-        # MUST have DFW PROFESSIONAL SRL as issuer
-        has_dfw = 'DFW PROFESSIONAL' in raw_upper
-        if not has_dfw:
-            continue
-        
-        # Try to match either INVOICE or FACTURA format
-        invoice_number = None
-        
-        # Pattern 1: "INVOICE No 63" format
-        invoice_match = re.search(r'INVOICE\s*N[oOοº°]\.?\s*:?\s*(\d+)', raw_text, re.IGNORECASE)
-        if invoice_match:
-            invoice_number = int(invoice_match.group(1))
-        else:
-            # Check filename for invoice number
-            filename_match = re.search(r'[Ii]nvoice\s*[Nn][oOοº°]?\s*(\d+)', row['filename'] or '')
-            if filename_match:
-                invoice_number = int(filename_match.group(1))
-        
-        # Pattern 2: "FACTURA" with DFW format (look for invoice number)
-        if not invoice_number and 'FACTURA' in raw_upper:
-            # Try to extract factura number from text or filename
-            factura_match = re.search(r'FACTURA\s+(?:FISCALĂ|SERIA)?\s*[\w\s]*?[:\s]*([A-Z]?\d+)', raw_text, re.IGNORECASE)
-            if factura_match:
-                num_str = factura_match.group(1)
-                # Extract just the digits
-                digit_match = re.search(r'(\d+)', num_str)
-                if digit_match:
-                    invoice_number = int(digit_match.group(1))
-        
-        if not invoice_number:
-            continue
-        
-        # Must be in range 1-90
-        if invoice_number < 1 or invoice_number > 90:
-            continue
+        invoice_number = row['dfw_invoice_number']
+        text_amount = row['dfw_amount']
+        text_date = row['dfw_date']
+        recipient = row['dfw_recipient']
         
         # Handle duplicates - keep the one with amount if available
         if invoice_number in seen_invoice_numbers:
             continue
         seen_invoice_numbers.add(invoice_number)
         
-        # Extract amount from text if not already parsed
+        # Fall back to the amount in the text if not already parsed
         amount = row['amount']
         currency = row['currency'] or 'EUR'
+        if not amount and text_amount is not None:
+            amount = text_amount
         
-        if not amount:
-            # Try various patterns for amount extraction
-            amount_patterns = [
-                # INVOICE format patterns
-                r'TOTAL\s*EUR\s*€?([\d,\.]+)',
-                r'TOTAL\s*:?\s*€?([\d,\.]+)',
-                r'AMOUNT\s*:?\s*€?([\d,\.]+)',
-                # FACTURA format patterns (Romanian)
-                r'TOTAL\s*DE\s*PLATĂ\s*:?\s*€?([\d,\.]+)',
-                r'TOTAL\s*FACTURĂ\s*:?\s*€?([\d,\.]+)',
-                r'TOTAL\s*GENERAL\s*:?\s*€?([\d,\.]+)',
-                r'DE\s*PLATĂ\s*:?\s*€?([\d,\.]+)',
-            ]
-            
-            for pattern in amount_patterns:
-                total_match = re.search(pattern, raw_text, re.IGNORECASE)
-                if total_match:
-                    try:
-                        amount_str = total_match.group(1).replace(',', '')
-                        # Handle European number format: 1.234,56 -> 1234.56
-                        if '.' in amount_str and amount_str.count('.') > 1:
-                            amount_str = amount_str.replace('.', '')
-                        amount = float(amount_str)
-                        break
-                    except:
-                        pass
-        
-        # Convert RON amounts to EUR (exchange rate ~4.97)
+        # Convert RON amounts to EUR
         if currency == 'RON' and amount:
-            amount = amount / 4.97
+            amount = amount / RON_PER_EUR
             currency = 'EUR'
         
-        # Extract invoice date
-        invoice_date = row['invoice_date']
-        if not invoice_date:
-            date_match = re.search(r'Date\s*:?\s*(\d{1,2}[/\.-]\d{1,2}[/\.-]\d{2,4})', raw_text, re.IGNORECASE)
-            invoice_date = date_match.group(1) if date_match else ''
-        
-        # Extract recipient/customer
-        recipient = ''
-        customer_patterns = [
-            r'(JTAPE\s+Limited)',
-            r'(Amba\s+Group\s+Ltd)',
-            r'(DTC\s+[A-Za-z\s]+Ltd)',
-            r'(Bellini[^\n]{0,30})',
-            r'(Bodyshop[^\n]{0,30})',
-            r'(BAXT[^\n]{0,30})',
-        ]
-        for pattern in customer_patterns:
-            match = re.search(pattern, raw_text, re.IGNORECASE)
-            if match:
-                recipient = match.group(1).strip()[:40]
-                break
+        invoice_date = row['invoice_date'] or text_date
         
         dfw_invoices.append({
             'id': row['id'],
@@ -1017,24 +1709,12 @@ def get_dfw_invoices():
     
     # Also include manually assigned items (assigned_tab = 'dfw')
     seen_ids = set(inv['id'] for inv in dfw_invoices)
-    
-    cursor.execute('''
-        SELECT 
-            pi.id, pi.invoice_number, pi.invoice_date, pi.amount, pi.currency,
-            a.filename, a.file_path, a.id as attachment_id,
-            e.id as email_id, e.date_received, e.from_address
-        FROM parsed_invoices pi
-        JOIN attachments a ON pi.attachment_id = a.id
-        JOIN emails e ON pi.email_id = e.id
-        WHERE pi.assigned_tab = 'dfw' AND (pi.hidden IS NULL OR pi.hidden = 0)
-    ''')
-    
-    for row in cursor.fetchall():
+    for row in assigned_rows:
         if row['id'] not in seen_ids:
             amount = row['amount']
             currency = row['currency'] or 'EUR'
             if currency == 'RON' and amount:
-                amount = amount / 4.97
+                amount = amount / RON_PER_EUR
                 currency = 'EUR'
             
             dfw_invoices.append({
@@ -1064,95 +1744,28 @@ def get_jtape_invoices():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT 
-            pi.id,
-            pi.invoice_number,
-            pi.invoice_date,
-            pi.amount,
-            pi.currency,
-            pi.raw_text,
-            a.filename,
-            a.file_path,
-            a.id as attachment_id,
-            e.id as email_id,
-            e.date_received,
-            e.from_address,
-            e.subject
-        FROM parsed_invoices pi
-        JOIN attachments a ON pi.attachment_id = a.id
-        JOIN emails e ON pi.email_id = e.id
-        ORDER BY e.date_received DESC
-    ''')
-    
     jtape_invoices = []
     seen_files = set()
+    assigned_rows = []
     
-    # Exclusion patterns
-    exclude_patterns = [
-        'packing list', 'rohel trans', 'cmr', 'fedex', 'dhl'
-    ]
-    
-    for row in cursor.fetchall():
-        raw_text = row['raw_text'] or ''
-        raw_upper = raw_text.upper()
-        filename = row['filename'] or ''
-        filename_lower = filename.lower()
-        
-        # Skip excluded documents
-        combined = (raw_text + ' ' + filename).lower()
-        if any(exc in combined for exc in exclude_patterns):
-            continue
-        
-        # Must have JTAPE reference in text or filename
-        has_jtape = 'JTAPE' in raw_upper or 'J-TAPE' in raw_upper or 'jtape' in filename_lower or 'j-tape' in filename_lower
-        if not has_jtape:
+    for row, fields, _ in get_invoice_catalog(cursor):
+        # The catalog also carries manually assigned rows; they are added after the matches
+        if row['assigned_tab'] == 'jtape' and not row['hidden']:
+            assigned_rows.append(row)
+        if fields is None:
             continue
+        doc_number, doc_type, text_amount, text_date = fields
+        filename = row['filename'] or ''
         
         # Skip duplicates by filename
         if filename in seen_files:
             continue
         seen_files.add(filename)
         
-        # Extract document number - try PO #, Invoice No, Proforma No
-        doc_number = None
-        # PO format like J9851
-        po_match = re.search(r'\b(J\d{4,6})\b', raw_text + ' ' + filename)
-        if po_match:
-            doc_number = po_match.group(1)
-        else:
-            # Invoice No format
-            inv_match = re.search(r'(?:INVOICE|PROFORMA)\s*N[oOοº°]?\.?\s*:?\s*(\d+)', raw_text, re.IGNORECASE)
-            if inv_match:
-                doc_number = inv_match.group(1)
-            else:
-                # Extract number from filename
-                fn_match = re.search(r'(\d+)', filename)
-                doc_number = fn_match.group(1) if fn_match else 'N/A'
-        
-        # Determine document type
-        doc_type = 'Invoice'
-        if 'PROFORMA' in raw_upper or 'proforma' in filename_lower:
-            doc_type = 'Proforma'
-        elif 'PURCHASE ORDER' in raw_upper or 'PO' in filename.upper():
-            doc_type = 'PO'
-        
-        # Extract amount (European format)
         amount = row['amount']
-        if not amount:
-            total_match = re.search(r'Total\s*[€£]?\s*:?\s*([\d.,]+)', raw_text, re.IGNORECASE)
-            if total_match:
-                try:
-                    amt_str = total_match.group(1)
-                    if ',' in amt_str:
-                        amt_str = amt_str.replace('.', '').replace(',', '.')
-                    amount = float(amt_str)
-                except:
-                    pass
-        
-        # Extract date
-        date_match = re.search(r'(?:Date|Order Date)\s*:?\s*(\d{1,2}[/\.]\d{1,2}[/\.]\d{2,4})', raw_text)
-        order_date = date_match.group(1) if date_match else row['invoice_date'] or ''
+        if not amount and text_amount is not None:
+            amount = text_amount
+        order_date = text_date if text_date is not None else row['invoice_date'] or ''
         
         jtape_invoices.append({
             'id': row['id'],
@@ -1167,28 +1780,7 @@ def get_jtape_invoices():
         })
     
     # Add manually assigned items (assigned_tab = 'jtape')
-    seen_ids = set(inv['id'] for inv in jtape_invoices)
-    cursor.execute('''
-        SELECT pi.id, pi.invoice_number, pi.invoice_date, pi.amount, pi.currency,
-               a.filename, a.file_path, a.id as attachment_id, e.date_received, e.from_address
-        FROM parsed_invoices pi
-        JOIN attachments a ON pi.attachment_id = a.id
-        JOIN emails e ON pi.email_id = e.id
-        WHERE pi.assigned_tab = 'jtape' AND (pi.hidden IS NULL OR pi.hidden = 0)
-    ''')
-    for row in cursor.fetchall():
-        if row['id'] not in seen_ids:
-            amount = row['amount']
-            if row['currency'] == 'RON' and amount:
-                amount = amount / 4.97
-            jtape_invoices.append({
-                'id': row['id'], 'attachment_id': row['attachment_id'],
-                'invoice_number': row['invoice_number'] or row['filename'][:15],
-                'doc_type': 'Assigned', 'invoice_date': row['invoice_date'] or '',
-                'email_date': row['date_received'][:10] if row['date_received'] else '',
-                'amount': amount, 'currency': 'EUR', 'filename': row['filename'],
-                'manually_assigned': True
-            })
+    append_assigned_invoices(jtape_invoices, assigned_rows, True, doc_type='Assigned')
     
     conn.close()
     return jsonify(jtape_invoices)
@@ -1199,103 +1791,28 @@ def get_amba_invoices():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT 
-            pi.id,
-            pi.invoice_number,
-            pi.invoice_date,
-            pi.amount,
-            pi.currency,
-            pi.raw_text,
-            a.filename,
-            a.file_path,
-            a.id as attachment_id,
-            e.id as email_id,
-            e.date_received,
-            e.from_address,
-            e.subject
-        FROM parsed_invoices pi
-        JOIN attachments a ON pi.attachment_id = a.id
-        JOIN emails e ON pi.email_id = e.id
-        ORDER BY e.date_received DESC
-    ''')
-    
     amba_invoices = []
     seen_files = set()
+    assigned_rows = []
     
-    # Exclusion patterns
-    exclude_patterns = [
-        'packing list', 'rohel trans', 'cmr', 'fedex', 'dhl', 'dtc5',  # DTC5xxxx are design files
-        'cds import', 'transaction confirmation'
-    ]
-    
-    for row in cursor.fetchall():
-        raw_text = row['raw_text'] or ''
-        raw_upper = raw_text.upper()
-        filename = row['filename'] or ''
-        filename_lower = filename.lower()
-        
-        # Skip excluded documents
-        combined = (raw_text + ' ' + filename).lower()
-        if any(exc in combined for exc in exclude_patterns):
-            continue
-        
-        # Must have Amba or BAXT reference
-        has_amba = 'AMBA' in raw_upper or 'amba' in filename_lower
-        has_baxt = 'BAXT' in raw_upper or 'baxt' in filename_lower
-        
-        if not (has_amba or has_baxt):
+    for row, _, fields in get_invoice_catalog(cursor):
+        # The catalog also carries manually assigned rows; they are added after the matches
+        if row['assigned_tab'] == 'amba' and not row['hidden']:
+            assigned_rows.append(row)
+        if fields is None:
             continue
+        doc_number, doc_type, text_amount, text_date, customer = fields
+        filename = row['filename'] or ''
         
         # Skip duplicates by filename
         if filename in seen_files:
             continue
         seen_files.add(filename)
         
-        # Extract document number - try PO #, Invoice No, Proforma No
-        doc_number = None
-        
-        # PO format
-        po_match = re.search(r'PO\s*NO\s*([A-Z]?[-\d]+\w*)', raw_text, re.IGNORECASE)
-        if po_match:
-            doc_number = po_match.group(1)
-        else:
-            po_match = re.search(r'Order\s*No\.?\s*(\d{6,})', raw_text, re.IGNORECASE)
-            if po_match:
-                doc_number = po_match.group(1)
-        
-        if not doc_number:
-            # Invoice/Proforma No format
-            inv_match = re.search(r'(?:INVOICE|PROFORMA)\s*N[oOοº°]?\.?\s*:?\s*(\d+)', raw_text, re.IGNORECASE)
-            if inv_match:
-                doc_number = inv_match.group(1)
-            else:
-                # Extract number from filename
-                fn_match = re.search(r'(\d+)', filename)
-                doc_number = fn_match.group(1) if fn_match else 'N/A'
-        
-        # Extract amount
         amount = row['amount']
-        if not amount:
-            total_match = re.search(r'TOTAL\s*(?:EUR)?\s*€?([\d,\.]+)', raw_text, re.IGNORECASE)
-            if total_match:
-                try:
-                    amount = float(total_match.group(1).replace(',', ''))
-                except:
-                    pass
-        
-        # Determine document type
-        doc_type = 'Invoice'
-        if 'PROFORMA' in raw_upper or 'proforma' in filename_lower:
-            doc_type = 'Proforma'
-        elif 'PURCHASE ORDER' in raw_upper or 'PO' in filename.upper():
-            doc_type = 'PO'
-        
-        # Extract date
-        date_match = re.search(r'(?:Date|Purchase Order Date)\s*:?\s*(\d{1,2}[\s/\.]\w+[\s/\.]\d{2,4})', raw_text)
-        order_date = date_match.group(1) if date_match else row['invoice_date'] or ''
-        
-        customer = 'BAXT' if has_baxt else 'Amba Group'
+        if not amount and text_amount is not None:
+            amount = text_amount
+        order_date = text_date if text_date is not None else row['invoice_date'] or ''
         
         amba_invoices.append({
             'id': row['id'],
@@ -1311,28 +1828,7 @@ def get_amba_invoices():
         })
     
     # Add manually assigned items (assigned_tab = 'amba')
-    seen_ids = set(inv['id'] for inv in amba_invoices)
-    cursor.execute('''
-        SELECT pi.id, pi.invoice_number, pi.invoice_date, pi.amount, pi.currency,
-               a.filename, a.id as attachment_id, e.date_received
-        FROM parsed_invoices pi
-        JOIN attachments a ON pi.attachment_id = a.id
-        JOIN emails e ON pi.email_id = e.id
-        WHERE pi.assigned_tab = 'amba' AND (pi.hidden IS NULL OR pi.hidden = 0)
-    ''')
-    for row in cursor.fetchall():
-        if row['id'] not in seen_ids:
-            amount = row['amount']
-            if row['currency'] == 'RON' and amount:
-                amount = amount / 4.97
-            amba_invoices.append({
-                'id': row['id'], 'attachment_id': row['attachment_id'],
-                'invoice_number': row['invoice_number'] or row['filename'][:15],
-                'doc_type': 'Assigned', 'invoice_date': row['invoice_date'] or '',
-                'email_date': row['date_received'][:10] if row['date_received'] else '',
-                'customer': 'Assigned', 'amount': amount, 'currency': 'EUR',
-                'filename': row['filename'], 'manually_assigned': True
-            })
+    append_assigned_invoices(amba_invoices, assigned_rows, True, doc_type='Assigned', customer='Assigned')
     
     conn.close()
     return jsonify(amba_invoices)
@@ -1351,6 +1847,7 @@ def get_supplier_invoices():
             pi.amount,
             pi.currency,
             pi.raw_text,
+            CASE WHEN pi.assigned_tab = 'supplier' AND (pi.hidden IS NULL OR pi.hidden = 0) THEN 1 ELSE 0 END as manually_assigned,
             a.filename,
             a.file_path,
             a.id as attachment_id,
@@ -1361,17 +1858,25 @@ def get_supplier_invoices():
         FROM parsed_invoices pi
         JOIN attachments a ON pi.attachment_id = a.id
         JOIN emails e ON pi.email_id = e.id
+        WHERE a.filename LIKE 'ΤΙΜ%' OR a.filename LIKE 'ΔΑ%'
+           OR (pi.assigned_tab = 'supplier' AND (pi.hidden IS NULL OR pi.hidden = 0))
         ORDER BY e.date_received DESC
     ''')
     
     supplier_invoices = []
     seen_inv = set()
+    assigned_rows = []
     
-    for row in cursor.fetchall():
+    for row in cursor:
+        # Manually assigned rows come back in the same query; they are added after the matches
+        if row['manually_assigned']:
+            assigned_rows.append(row)
+        
         raw_text = row['raw_text'] or ''
         filename = row['filename'] or ''
         
-        # Must be a ΡΟΤΟΜΠΟΠ (Rotopak) invoice starting with ΤΙΜ or ΔΑ (as user specified)
+        # Must be a ΡΟΤΟΜΠΟΠ (Rotopak) invoice starting with ΤΙΜ or ΔΑ (as user specified;
+        # pre-filtered by LIKE in the query, which is case-sensitive for Greek)
         # ΤΙΜ = Τιμολόγιο (Invoice), ΔΑ = Δελτίο Αποστολής (Delivery Note)
         is_greek_invoice = filename.startswith('ΤΙΜ') or filename.startswith('ΔΑ')
         
@@ -1382,17 +1887,17 @@ def get_supplier_invoices():
         inv_number = row['invoice_number']
         if not inv_number or inv_number == 'N/A':
             # Try ΤΙΜ format
-            inv_match = re.search(r'(ΤΙΜ\d+)', filename)
+            inv_match = SUPPLIER_TIM_NO_RE.search(filename)
             if inv_match:
                 inv_number = inv_match.group(1)
             else:
                 # Try ΔΑ format
-                inv_match = re.search(r'(ΔΑ\d+)', filename)
+                inv_match = SUPPLIER_DA_NO_RE.search(filename)
                 if inv_match:
                     inv_number = inv_match.group(1)
                 else:
                     # Try Greek text format
-                    inv_match = re.search(r'Νούμερο[^\d]*(\d+)', raw_text)
+                    inv_match = SUPPLIER_NUMBER_RE.search(raw_text)
                     inv_number = inv_match.group(1) if inv_match else filename.split('.')[0]
         
         # Skip duplicates
@@ -1403,11 +1908,11 @@ def get_supplier_invoices():
         # Extract amount - look for Greek "Καθαρή Αξία" (Net Value) or "Σύνολο" (Total)
         amount = None
         # Try Καθαρή Αξία: 13275,00 € pattern
-        total_match = re.search(r'Καθαρή Αξία:\s*([\d.,]+)\s*€?', raw_text)
+        total_match = SUPPLIER_NET_VALUE_RE.search(raw_text)
         if not total_match:
-            total_match = re.search(r'Σύνολο[^\d]*([\d.,]+)', raw_text)
+            total_match = SUPPLIER_TOTAL_RE.search(raw_text)
         if not total_match:
-            total_match = re.search(r'Αξία \(€\)[^\d]*([\d.,]+)', raw_text)
+            total_match = SUPPLIER_VALUE_RE.search(raw_text)
         
         if total_match:
             try:
@@ -1435,28 +1940,7 @@ def get_supplier_invoices():
         })
     
     # Add manually assigned items (assigned_tab = 'supplier')
-    seen_ids = set(inv['id'] for inv in supplier_invoices)
-    cursor.execute('''
-        SELECT pi.id, pi.invoice_number, pi.invoice_date, pi.amount, pi.currency,
-               a.filename, a.id as attachment_id, e.date_received
-        FROM parsed_invoices pi
-        JOIN attachments a ON pi.attachment_id = a.id
-        JOIN emails e ON pi.email_id = e.id
-        WHERE pi.assigned_tab = 'supplier' AND (pi.hidden IS NULL OR pi.hidden = 0)
-    ''')
-    for row in cursor.fetchall():
-        if row['id'] not in seen_ids:
-            amount = row['amount']
-            if row['currency'] == 'RON' and amount:
-                amount = amount / 4.97
-            supplier_invoices.append({
-                'id': row['id'], 'attachment_id': row['attachment_id'],
-                'invoice_number': row['invoice_number'] or row['filename'][:15],
-                'invoice_date': row['invoice_date'] or '',
-                'email_date': row['date_received'][:10] if row['date_received'] else '',
-                'supplier': 'Assigned', 'amount': amount, 'currency': 'EUR',
-                'filename': row['filename'], 'manually_assigned': True
-            })
+    append_assigned_invoices(supplier_invoices, assigned_rows, True, supplier='Assigned')
     
     conn.close()
     return jsonify(supplier_invoices)
@@ -1482,6 +1966,7 @@ def get_contrast_invoices():
             pi.amount,
             pi.currency,
             pi.raw_text,
+            CASE WHEN pi.assigned_tab = 'contrast' THEN 1 ELSE 0 END as manually_assigned,
             pi.assigned_tab,
             a.filename,
             a.file_path,
@@ -1493,35 +1978,45 @@ def get_contrast_invoices():
         FROM parsed_invoices pi
         JOIN attachments a ON pi.attachment_id = a.id
         JOIN emails e ON pi.email_id = e.id
-        WHERE pi.hidden IS NULL OR pi.hidden = 0
+        WHERE (pi.hidden IS NULL OR pi.hidden = 0)
+          AND (pi.assigned_tab = 'contrast'
+               OR pi.raw_text LIKE '%CONTRAST%' OR pi.raw_text LIKE '%SMARTTAX%' OR pi.raw_text LIKE '%GITS TAX%'
+               OR a.filename LIKE '%factura%' OR a.filename LIKE '%OSR%')
         ORDER BY e.date_received DESC
     ''')
     
     contrast_invoices = []
     seen_files = set()
+    assigned_rows = []
     
-    for row in cursor.fetchall():
+    for row in cursor:
+        # Manually assigned rows come back in the same query; they are added after the matches
+        if row['manually_assigned']:
+            assigned_rows.append(row)
+        
         raw_text = row['raw_text'] or ''
-        raw_upper = raw_text.upper()
         filename = row['filename'] or ''
         
         # Include if manually assigned to contrast
         is_assigned = row['assigned_tab'] == 'contrast'
         
-        # Exclude Rohel Trans (transport company) unless manually assigned
-        if 'ROHEL' in raw_upper and not is_assigned:
-            continue
-        
-        # Check for accounting/service invoice markers
-        has_contrast = ('CONTRAST ACCOUNTANCY' in raw_upper or 
-                       ('CONTRAST' in raw_upper and 'J40/9369/2015' in raw_text))
-        has_smarttax = 'SMARTTAX' in raw_upper or 'GITS TAX' in raw_upper
-        has_factura = ('factura' in filename.lower() and 'ROH' not in filename.upper())
-        has_osr = 'OSR' in filename.upper()  # OSR invoices
-        
         # Include if assigned OR matches accounting criteria
-        if not is_assigned and not (has_contrast or has_smarttax or has_factura or has_osr):
-            continue
+        if not is_assigned:
+            raw_upper = raw_text.upper()
+            filename_upper = filename.upper()
+            
+            # Exclude Rohel Trans (transport company) unless manually assigned
+            if 'ROHEL' in raw_upper:
+                continue
+            
+            # Check for accounting/service invoice markers (the query's LIKEs only narrow the candidates);
+            # the short filename checks go first so they can skip the raw_text scans
+            if not (('FACTURA' in filename_upper and 'ROH' not in filename_upper) or
+                    'OSR' in filename_upper or  # OSR invoices
+                    'CONTRAST ACCOUNTANCY' in raw_upper or
+                    ('CONTRAST' in raw_upper and 'J40/9369/2015' in raw_text) or
+                    'SMARTTAX' in raw_upper or 'GITS TAX' in raw_upper):
+                continue
         
         # Skip duplicates by filename
         if filename in seen_files:
@@ -1532,28 +2027,28 @@ def get_contrast_invoices():
         inv_number = row['invoice_number']
         if not inv_number or inv_number == 'N/A' or inv_number == '/':
             # Try various patterns
-            nr_match = re.search(r'Nr\.?\s*Factur[ia]+\s*:?\s*(\d+)', raw_text, re.IGNORECASE)
+            nr_match = CONTRAST_NR_FACTURA_RE.search(raw_text)
             if not nr_match:
-                nr_match = re.search(r'Seria\s+\w+\s+nr:?\s*(\d+)', raw_text, re.IGNORECASE)
+                nr_match = CONTRAST_SERIA_NR_RE.search(raw_text)
             if not nr_match:
                 # Try filename patterns like "FACTURAINVOICE_2025_INV_OSR_162028.pdf"
-                nr_match = re.search(r'OSR[_-]?(\d+)', filename, re.IGNORECASE)
+                nr_match = CONTRAST_OSR_RE.search(filename)
             if not nr_match:
-                nr_match = re.search(r'Factura[_-]nr[_-]?(\w+)', filename, re.IGNORECASE)
+                nr_match = CONTRAST_FACTURA_NR_RE.search(filename)
             if not nr_match:
-                nr_match = re.search(r'factura[_-]?(\d+)', filename, re.IGNORECASE)
+                nr_match = CONTRAST_FACTURA_RE.search(filename)
             if not nr_match:
-                nr_match = re.search(r'(\d+)', filename)
+                nr_match = DIGITS_RE.search(filename)
             inv_number = nr_match.group(1) if nr_match else filename.split('.')[0][:20]
         
         # Extract date
-        date_match = re.search(r'Data\s*\([^)]+\)\s*:?\s*(\d{1,2}[\./-]\d{1,2}[\./-]\d{2,4})', raw_text)
+        date_match = CONTRAST_DATE_RE.search(raw_text)
         invoice_date = date_match.group(1) if date_match else row['invoice_date'] or ''
         
         # Extract amount (Total de plata)
         amount = row['amount']
         if not amount:
-            total_match = re.search(r'Total\s*(?:de plat[aă])?\s*:?\s*([\d\.,]+)', raw_text, re.IGNORECASE)
+            total_match = CONTRAST_TOTAL_RE.search(raw_text)
             if total_match:
                 try:
                     amount = float(total_match.group(1).replace('.', '').replace(',', '.'))
@@ -1572,27 +2067,9 @@ def get_contrast_invoices():
         })
     
     # Add manually assigned items (assigned_tab = 'contrast')
-    seen_ids = set(inv['id'] for inv in contrast_invoices)
-    cursor.execute('''
-        SELECT pi.id, pi.invoice_number, pi.invoice_date, pi.amount, pi.currency,
-               a.filename, a.id as attachment_id, e.date_received
-        FROM parsed_invoices pi
-        JOIN attachments a ON pi.attachment_id = a.id
-        JOIN emails e ON pi.email_id = e.id
-        WHERE pi.assigned_tab = 'contrast' AND (pi.hidden IS NULL OR pi.hidden = 0)
-    ''')
-    for row in cursor.fetchall():
-        if row['id'] not in seen_ids:
-            contrast_invoices.append({
-                'id': row['id'], 'attachment_id': row['attachment_id'],
-                'invoice_number': row['invoice_number'] or row['filename'][:15],
-                'invoice_date': row['invoice_date'] or '',
-                'email_date': row['date_received'][:10] if row['date_received'] else '',
-                'amount': row['amount'], 'currency': row['currency'] or 'EUR',
-                'filename': row['filename'], 'manually_assigned': True
-            })
+    append_assigned_invoices(contrast_invoices, assigned_rows, False)
     
-    # Sort by invoice number
+    # Sort by invoice number; most numbers are extracted from raw_text/filename above, so this can't be an ORDER BY
     contrast_invoices.sort(key=lambda x: int(x['invoice_number']) if x['invoice_number'].isdigit() else 0)
     
     conn.close()
@@ -1612,6 +2089,7 @@ def get_proforma_invoices():
             pi.amount,
             pi.currency,
             pi.raw_text,
+            CASE WHEN pi.assigned_tab = 'proforma' THEN 1 ELSE 0 END as manually_assigned,
             pi.assigned_tab,
             a.filename,
             a.file_path,
@@ -1624,27 +2102,36 @@ def get_proforma_invoices():
         JOIN attachments a ON pi.attachment_id = a.id
         JOIN emails e ON pi.email_id = e.id
         WHERE (pi.hidden IS NULL OR pi.hidden = 0)
+          AND (pi.assigned_tab = 'proforma'
+               OR pi.raw_text LIKE '%PROFORMA%' OR pi.raw_text LIKE '%PRO FORMA%'
+               OR a.filename LIKE '%proforma%' OR a.filename LIKE '%pro forma%')
         ORDER BY e.date_received DESC
     ''')
     
     proforma_invoices = []
     seen_files = set()
+    assigned_rows = []
     
-    for row in cursor.fetchall():
+    for row in cursor:
+        # Manually assigned rows come back in the same query; they are added after the matches
+        if row['manually_assigned']:
+            assigned_rows.append(row)
+        
         raw_text = row['raw_text'] or ''
-        raw_upper = raw_text.upper()
         filename = row['filename'] or ''
-        filename_lower = filename.lower()
         
         # Include if manually assigned to proforma
         is_assigned = row['assigned_tab'] == 'proforma'
         
-        # Check for proforma markers
-        has_proforma = ('PROFORMA' in raw_upper or 'PRO FORMA' in raw_upper or
-                       'proforma' in filename_lower or 'pro forma' in filename_lower)
-        
-        if not is_assigned and not has_proforma:
-            continue
+        if not is_assigned:
+            # Check for proforma markers (pre-filtered by LIKE in the query)
+            raw_upper = raw_text.upper()
+            filename_lower = filename.lower()
+            has_proforma = ('PROFORMA' in raw_upper or 'PRO FORMA' in raw_upper or
+                           'proforma' in filename_lower or 'pro forma' in filename_lower)
+            
+            if not has_proforma:
+                continue
         
         # Skip duplicates by filename
         if filename in seen_files:
@@ -1654,17 +2141,17 @@ def get_proforma_invoices():
         # Extract invoice number
         inv_number = row['invoice_number']
         if not inv_number or inv_number == 'N/A':
-            nr_match = re.search(r'(?:PROFORMA|PRO\s*FORMA)\s*(?:INVOICE\s*)?N[oOοº°]?\.?\s*:?\s*(\d+)', raw_text, re.IGNORECASE)
+            nr_match = PROFORMA_NO_RE.search(raw_text)
             if not nr_match:
-                nr_match = re.search(r'Proforma\s*No\s*(\d+)', filename, re.IGNORECASE)
+                nr_match = PROFORMA_FILENAME_NO_RE.search(filename)
             if not nr_match:
-                nr_match = re.search(r'(\d+)', filename)
+                nr_match = DIGITS_RE.search(filename)
             inv_number = nr_match.group(1) if nr_match else filename.split('.')[0][:20]
         
         # Extract amount (European format)
         amount = row['amount']
         if not amount:
-            total_match = re.search(r'Total\s*(?:EUR|€)?\s*:?\s*€?\s*([\d.,]+)', raw_text, re.IGNORECASE)
+            total_match = PROFORMA_TOTAL_RE.search(raw_text)
             if total_match:
                 try:
                     amt_str = total_match.group(1)
@@ -1692,25 +2179,7 @@ def get_proforma_invoices():
         })
     
     # Add manually assigned items (assigned_tab = 'proforma')
-    seen_ids = set(inv['id'] for inv in proforma_invoices)
-    cursor.execute('''
-        SELECT pi.id, pi.invoice_number, pi.invoice_date, pi.amount, pi.currency,
-               a.filename, a.id as attachment_id, e.date_received
-        FROM parsed_invoices pi
-        JOIN attachments a ON pi.attachment_id = a.id
-        JOIN emails e ON pi.email_id = e.id
-        WHERE pi.assigned_tab = 'proforma' AND (pi.hidden IS NULL OR pi.hidden = 0)
-    ''')
-    for row in cursor.fetchall():
-        if row['id'] not in seen_ids:
-            proforma_invoices.append({
-                'id': row['id'], 'attachment_id': row['attachment_id'],
-                'invoice_number': row['invoice_number'] or row['filename'][:15],
-                'invoice_date': row['invoice_date'] or '',
-                'email_date': row['date_received'][:10] if row['date_received'] else '',
-                'amount': row['amount'], 'currency': row['currency'] or 'EUR',
-                'filename': row['filename'], 'manually_assigned': True
-            })
+    append_assigned_invoices(proforma_invoices, assigned_rows, False)
     
     conn.close()
     return jsonify(proforma_invoices)
@@ -1729,11 +2198,21 @@ def get_attachment(attachment_id):
         return jsonify({'error': 'Attachment not found'}), 404
     
     file_path = row['file_path']
-    if not os.path.exists(file_path):
+    if not file_path:
         return jsonify({'error': 'File not found on disk'}), 404
     
     from flask import send_file
-    return send_file(file_path, mimetype=row['content_type'] or 'application/pdf')
+    # Repeat previews revalidate against the ETag/mtime and get a 304 instead of the whole file;
+    # send_file stats the path anyway, so a missing file surfaces here without a separate exists()
+    try:
+        response = send_file(file_path, mimetype=row['content_type'] or 'application/pdf',
+                             conditional=True, etag=True, max_age=3600)
+    except FileNotFoundError:
+        return jsonify({'error': 'File not found on disk'}), 404
+    # Invoices are private documents, so keep them out of shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 @app.route('/api/attachment/info/<int:attachment_id>')
 def get_attachment_info(attachment_id):
@@ -1755,12 +2234,59 @@ def get_attachment_info(attachment_id):
     
     return jsonify(dict(row))
 
+def detect_attachment_tab(raw_text, filename):
+    """Return the tab a document naturally belongs to from its text and filename, or '' if none."""
+    raw_upper = raw_text.upper()
+    filename_upper = filename.upper()
+    
+    # Check for Pro Forma first (before other checks)
+    if 'PROFORMA' in raw_upper or 'PRO FORMA' in raw_upper or 'PROFORMA' in filename_upper:
+        return 'proforma'
+    # Check for DFW invoices
+    if 'DFW PROFESSIONAL' in raw_upper or 'INVOICE NO' in filename_upper:
+        return 'dfw'
+    # Check for JTape
+    if 'JTAPE' in raw_upper or 'JTAPE' in filename_upper or 'J-TAPE' in filename_upper:
+        return 'jtape'
+    # Check for Amba/BAXT
+    if 'AMBA' in raw_upper or 'BAXT' in raw_upper or 'AMBA' in filename_upper or 'BAXT' in filename_upper:
+        return 'amba'
+    # Check for Rotopak/Supplier
+    if filename.startswith(('ΤΙΜ', 'ΔΑ')):
+        return 'supplier'
+    # Check for Contrast/Accounting
+    if 'CONTRAST' in raw_upper or 'SMARTTAX' in raw_upper or 'GITS TAX' in raw_upper:
+        return 'contrast'
+    return ''
+
+def classify_attachment_tabs(conn, cursor):
+    """Store detect_attachment_tab results in parsed_invoices.detected_tab for rows not yet classified."""
+    cursor.execute('SELECT 1 FROM parsed_invoices WHERE detected_tab IS NULL LIMIT 1')
+    if cursor.fetchone() is None:
+        return
+    
+    cursor.execute('''
+        SELECT pi.id, pi.raw_text, a.filename
+        FROM parsed_invoices pi
+        LEFT JOIN attachments a ON pi.attachment_id = a.id
+        WHERE pi.detected_tab IS NULL
+    ''')
+    updates = [(detect_attachment_tab(row['raw_text'] or '', row['filename'] or ''), row['id'])
+               for row in cursor]
+    
+    cursor.executemany('UPDATE parsed_invoices SET detected_tab = ? WHERE id = ?', updates)
+    conn.commit()
+
 @app.route('/api/attachments/all')
 def get_all_attachments():
     """Get ALL PDF attachments - for the All Attachments tab."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
+    # Tab detection runs once per new or re-parsed row, so raw_text is only read for
+    # attachments that were never parsed (NULL) or were parsed since the last backfill
+    classify_attachment_tabs(conn, cursor)
+    
     cursor.execute('''
         SELECT 
             a.id,
@@ -1778,7 +2304,8 @@ def get_all_attachments():
             pi.currency,
             pi.hidden,
             pi.assigned_tab,
-            pi.raw_text,
+            pi.detected_tab,
+            CASE WHEN pi.detected_tab IS NULL THEN pi.raw_text END as raw_text,
             pi.amount_edited
         FROM attachments a
         JOIN emails e ON a.email_id = e.id
@@ -1789,35 +2316,15 @@ def get_all_attachments():
     
     attachments = []
     
-    for row in cursor.fetchall():
+    for row in cursor:
         filename = row['filename'] or ''
         
         amount = row['amount']
         
         # Detect which tab this naturally belongs to
-        detected_tab = row['assigned_tab'] or ''
-        raw_upper = (row['raw_text'] or '').upper()
-        filename_upper = filename.upper()
-        
-        if not detected_tab:
-            # Check for Pro Forma first (before other checks)
-            if 'PROFORMA' in raw_upper or 'PRO FORMA' in raw_upper or 'proforma' in filename.lower():
-                detected_tab = 'proforma'
-            # Check for DFW invoices
-            elif 'DFW PROFESSIONAL' in raw_upper or 'INVOICE NO' in filename_upper:
-                detected_tab = 'dfw'
-            # Check for JTape
-            elif 'JTAPE' in raw_upper or 'JTAPE' in filename_upper or 'J-TAPE' in filename_upper:
-                detected_tab = 'jtape'
-            # Check for Amba/BAXT
-            elif 'AMBA' in raw_upper or 'BAXT' in raw_upper or 'AMBA' in filename_upper or 'BAXT' in filename_upper:
-                detected_tab = 'amba'
-            # Check for Rotopak/Supplier
-            elif filename.startswith('ΤΙΜ') or filename.startswith('ΔΑ'):
-                detected_tab = 'supplier'
-            # Check for Contrast/Accounting
-            elif 'CONTRAST' in raw_upper or 'SMARTTAX' in raw_upper or 'GITS TAX' in raw_upper:
-                detected_tab = 'contrast'
+        detected_tab = row['assigned_tab'] or row['detected_tab']
+        if detected_tab is None:
+            detected_tab = detect_attachment_tab(row['raw_text'] or '', filename)
         
         attachments.append({
             'id': row['id'],
@@ -1984,18 +2491,26 @@ def get_hidden_attachments():
         ORDER BY e.date_received DESC
     ''')
     
-    attachments = [dict(row) for row in cursor.fetchall()]
+    attachments = cursor.fetchall()
     conn.close()
     return jsonify(attachments)
 
 # Global variable to track sync status (last_sync loaded from DB)
 sync_status = {'running': False, 'last_sync': get_setting('last_sync'), 'message': 'Ready'}
+# Held while checking and claiming sync_status['running'] so two requests can't both start a sync
+sync_status_lock = threading.Lock()
+
+# last_sync is re-read this often so syncs finished by the other workers still show up
+LAST_SYNC_CACHE_SECONDS = 5
+last_sync_cache = {'expires': time.time() + LAST_SYNC_CACHE_SECONDS}
 
 @app.route('/api/sync/status')
 def get_sync_status():
     """Get the current sync status."""
-    # Always get fresh last_sync from database
-    sync_status['last_sync'] = get_setting('last_sync')
+    now = time.time()
+    if now >= last_sync_cache['expires']:
+        sync_status['last_sync'] = get_setting('last_sync')
+        last_sync_cache['expires'] = now + LAST_SYNC_CACHE_SECONDS
     return jsonify(sync_status)
 
 @app.route('/api/sync/cron', methods=['GET', 'POST'])
@@ -2008,12 +2523,13 @@ def cron_sync():
     
     global sync_status
     
-    if sync_status['running']:
-        return jsonify({'error': 'Sync already in progress', 'status': 'skipped'}), 200
+    with sync_status_lock:
+        if sync_status['running']:
+            return jsonify({'error': 'Sync already in progress', 'status': 'skipped'}), 200
+        sync_status['running'] = True
     
     # Run sync synchronously for cron (no threading needed)
     try:
-        sync_status['running'] = True
         sync_status['message'] = 'Cron sync started...'
         
         from email_archiver import EmailArchiver
@@ -2057,13 +2573,14 @@ def start_sync():
     """Start IMAP sync in background thread (for manual button clicks)."""
     global sync_status
     
-    if sync_status['running']:
-        return jsonify({'error': 'Sync already in progress'}), 400
+    with sync_status_lock:
+        if sync_status['running']:
+            return jsonify({'error': 'Sync already in progress'}), 400
+        sync_status['running'] = True
     
     def run_sync():
         global sync_status
         try:
-            sync_status['running'] = True
             sync_status['message'] = 'Syncing...'
             
             # Import here to avoid circular imports
@@ -2117,6 +2634,7 @@ def start_sync():
 @app.route('/api/chromadb/index_emails', methods=['POST'])
 def index_emails_to_chroma():
     """Index all emails into ChromaDB for semantic search."""
+    _, emails_collection, _ = get_chroma()
     if not emails_collection:
         return jsonify({'error': 'ChromaDB not initialized'}), 500
     
@@ -2130,46 +2648,49 @@ def index_emails_to_chroma():
             ORDER BY date_received DESC
         ''')
         
-        emails = cursor.fetchall()
-        conn.close()
-        
-        # Prepare data for ChromaDB
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for email in emails:
-            # Combine subject and body for better semantic search
-            text = f"{email['subject'] or ''}\n{email['body_text'] or ''}"
-            text = text.strip()
-            
-            if not text:
-                continue
-            
-            documents.append(text)
-            metadatas.append({
-                'email_id': email['id'],
-                'subject': email['subject'] or '',
-                'from_address': email['from_address'] or '',
-                'date': email['date_received'] or ''
-            })
-            ids.append(f"email_{email['id']}")
-        
-        # Add to ChromaDB in batches
+        # Add to ChromaDB one fetched batch at a time so only a single batch is held in memory
         batch_size = 100
         indexed_count = 0
         
-        for i in range(0, len(documents), batch_size):
-            batch_docs = documents[i:i+batch_size]
-            batch_metas = metadatas[i:i+batch_size]
-            batch_ids = ids[i:i+batch_size]
-            
-            emails_collection.upsert(
-                documents=batch_docs,
-                metadatas=batch_metas,
-                ids=batch_ids
-            )
-            indexed_count += len(batch_docs)
+        try:
+            while True:
+                emails = cursor.fetchmany(batch_size)
+                if not emails:
+                    break
+                
+                documents = []
+                metadatas = []
+                ids = []
+                
+                for email in emails:
+                    # Combine subject and body for better semantic search
+                    text = f"{email['subject'] or ''}\n{email['body_text'] or ''}"
+                    text = text.strip()
+                    
+                    if not text:
+                        continue
+                    
+                    documents.append(text)
+                    metadatas.append({
+                        'email_id': email['id'],
+                        'subject': email['subject'] or '',
+                        'from_address': email['from_address'] or '',
+                        'date': email['date_received'] or ''
+                    })
+                    ids.append(f"email_{email['id']}")
+                
+                if not documents:
+                    continue
+                
+                emails_collection.upsert(
+                    documents=documents,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+                indexed_count += len(documents)
+        finally:
+            conn.close()
+            clear_chroma_query_cache()
         
         return jsonify({
             'success': True,
@@ -2180,9 +2701,46 @@ def index_emails_to_chroma():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+SEARCH_PREVIEW_LENGTH = 500
+
+def load_search_previews(collection_type, metadatas):
+    """Map row id -> the first SEARCH_PREVIEW_LENGTH chars of the indexed text, for one page of hits.
+    
+    Chroma is queried without documents, so previews are truncated by the database
+    instead of shipping every full document back just to slice it.
+    """
+    id_key = 'email_id' if collection_type == 'emails' else 'invoice_id'
+    ids = [m[id_key] for m in metadatas if m and m.get(id_key) is not None]
+    if not ids:
+        return {}
+    
+    placeholders = ','.join('?' * len(ids))
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if collection_type == 'emails':
+            # Indexed text is subject + newline + body, so the subject eats into the preview
+            cursor.execute(f'''
+                SELECT id, subject, SUBSTR(body_text, 1, {SEARCH_PREVIEW_LENGTH}) AS body_preview
+                FROM emails WHERE id IN ({placeholders})
+            ''', ids)
+            return {
+                row['id']: f"{row['subject'] or ''}\n{row['body_preview'] or ''}".strip()[:SEARCH_PREVIEW_LENGTH]
+                for row in cursor.fetchall()
+            }
+        
+        cursor.execute(f'''
+            SELECT id, SUBSTR(raw_text, 1, {SEARCH_PREVIEW_LENGTH}) AS preview
+            FROM parsed_invoices WHERE id IN ({placeholders})
+        ''', ids)
+        return {row['id']: row['preview'] or '' for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
 @app.route('/api/chromadb/search', methods=['POST'])
 def semantic_search():
     """Perform semantic search across emails and invoices."""
+    _, emails_collection, invoices_collection = get_chroma()
     if not emails_collection:
         return jsonify({'error': 'ChromaDB not initialized'}), 500
     
@@ -2201,21 +2759,19 @@ def semantic_search():
         if not collection:
             return jsonify({'error': f'{collection_type} collection not available'}), 500
         
-        # Perform semantic search
-        results = collection.query(
-            query_texts=[query],
-            n_results=min(limit, 50),
-            include=['documents', 'metadatas', 'distances']
-        )
+        # Perform semantic search; whitespace-only differences share a cache entry
+        results = cached_chroma_query(collection, ' '.join(query.split()), min(limit, 50))
         
         # Format results
         formatted_results = []
         if results and results['ids'] and len(results['ids']) > 0:
+            previews = load_search_previews(collection_type, results['metadatas'][0])
             for i in range(len(results['ids'][0])):
+                metadata = results['metadatas'][0][i]
                 formatted_results.append({
                     'id': results['ids'][0][i],
-                    'document': results['documents'][0][i][:500],  # Truncate for preview
-                    'metadata': results['metadatas'][0][i],
+                    'document': previews.get(metadata.get('email_id' if collection_type == 'emails' else 'invoice_id'), ''),
+                    'metadata': metadata,
                     'similarity_score': 1 - results['distances'][0][i]  # Convert distance to similarity
                 })
         
@@ -2228,9 +2784,76 @@ def semantic_search():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Invoice embeddings are built off the request path, one run at a time; 'ready' is set
+# once the collection is known to be non-empty so suggestions can skip count()
+invoice_index_status = {'running': False, 'ready': False, 'indexed_count': 0, 'message': 'Ready'}
+invoice_index_lock = threading.Lock()
+chroma_executor = ThreadPoolExecutor(max_workers=1)
+
+def index_invoices_to_chroma(invoices_collection):
+    """Upsert every parsed invoice with text into ChromaDB, one fetched batch at a time."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    indexed_count = 0
+    try:
+        cursor.execute('''
+            SELECT pi.id, pi.raw_text, pi.invoice_number, pi.amount, pi.currency
+            FROM parsed_invoices pi
+            WHERE pi.raw_text IS NOT NULL AND pi.raw_text != ''
+        ''')
+        
+        while True:
+            invoices = cursor.fetchmany(100)
+            if not invoices:
+                break
+            
+            invoices_collection.upsert(
+                documents=[inv['raw_text'] for inv in invoices],
+                metadatas=[{
+                    'invoice_id': inv['id'],
+                    'invoice_number': inv['invoice_number'] or '',
+                    'amount': float(inv['amount']) if inv['amount'] else 0,
+                    'currency': inv['currency'] or 'EUR'
+                } for inv in invoices],
+                ids=[f"invoice_{inv['id']}" for inv in invoices]
+            )
+            indexed_count += len(invoices)
+            invoice_index_status['indexed_count'] = indexed_count
+        
+        invoice_index_status['message'] = f'Indexed {indexed_count} invoices'
+        if indexed_count:
+            invoice_index_status['ready'] = True
+    except Exception as e:
+        invoice_index_status['message'] = f'Invoice indexing error: {str(e)}'
+    finally:
+        conn.close()
+        clear_chroma_query_cache()
+        invoice_index_status['running'] = False
+
+def start_invoice_indexing(invoices_collection):
+    """Queue index_invoices_to_chroma unless a run is already in progress; return whether it was queued."""
+    with invoice_index_lock:
+        if invoice_index_status['running']:
+            return False
+        invoice_index_status.update(running=True, indexed_count=0, message='Indexing invoices...')
+    chroma_executor.submit(index_invoices_to_chroma, invoices_collection)
+    return True
+
+@app.route('/api/chromadb/index_invoices', methods=['POST'])
+def index_invoices_endpoint():
+    """Start (re)indexing all parsed invoices into ChromaDB in the background."""
+    _, _, invoices_collection = get_chroma()
+    if not invoices_collection:
+        return jsonify({'error': 'ChromaDB not initialized'}), 500
+    
+    if not start_invoice_indexing(invoices_collection):
+        return jsonify({'error': 'Invoice indexing already in progress'}), 400
+    return jsonify({'success': True, 'message': 'Invoice indexing started'})
+
 @app.route('/api/chromadb/status')
 def chromadb_status():
     """Get ChromaDB status and collection counts."""
+    chroma_client, emails_collection, invoices_collection = get_chroma()
     if not chroma_client:
         return jsonify({'initialized': False, 'message': 'ChromaDB not initialized'})
     
@@ -2241,7 +2864,13 @@ def chromadb_status():
         return jsonify({
             'initialized': True,
             'emails_indexed': email_count,
-            'invoices_indexed': invoice_count
+            'invoices_indexed': invoice_count,
+            'invoice_indexing': invoice_index_status,
+            'query_cache': {
+                'size': len(chroma_query_cache),
+                'hits': chroma_query_cache_stats['hits'],
+                'misses': chroma_query_cache_stats['misses']
+            }
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -2269,10 +2898,7 @@ def get_organization_files(domain):
             ORDER BY of.created_at DESC
         ''', (domain,))
         
-        files = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return jsonify({'files': files})
+        return stream_json_rows(conn, cursor, prefix='{"files":[', suffix=']}')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2425,31 +3051,29 @@ def list_organizations():
         cursor.execute('SELECT domain, display_name FROM organization_names')
         custom_names = {row['domain']: row['display_name'] for row in cursor.fetchall()}
         
-        # Get all unique domains from emails
+        # Get all unique domains from emails: SQLite dedupes the senders (off the from_address
+        # index), and each distinct From header is parsed like the entity lists parse it
         cursor.execute('''
-            SELECT DISTINCT 
-                CASE 
-                    WHEN sender LIKE '%@%' THEN LOWER(SUBSTR(sender, INSTR(sender, '@') + 1))
-                    ELSE NULL
-                END as domain
+            SELECT from_address
             FROM emails
-            WHERE domain IS NOT NULL
+            WHERE from_address LIKE '%@%'
+            GROUP BY from_address
         ''')
         
         domains = set()
-        for row in cursor.fetchall():
-            if row['domain']:
-                domains.add(row['domain'])
+        for row in cursor:
+            addr, _ = parse_sender(row['from_address'])
+            if '@' in addr:
+                domains.add(addr.split('@')[-1])
         
         conn.close()
         
-        # Build organization list
-        orgs = []
-        for domain in sorted(domains):
-            orgs.append({
-                'domain': domain,
-                'display_name': custom_names.get(domain, domain.split('.')[0].title())
-            })
+        # Build organization list; custom names are a small keyed table, merged here because
+        # the domains are parsed in Python and have nothing to JOIN on in SQL
+        orgs = [{
+            'domain': domain,
+            'display_name': custom_names.get(domain) or domain.split('.')[0].title()
+        } for domain in sorted(domains)]
         
         return jsonify(orgs)
     except Exception as e:
@@ -2501,6 +3125,7 @@ def get_organization_relationships():
 @app.route('/api/invoice/suggest_amount', methods=['POST'])
 def suggest_amount_from_vectors():
     """Use vector similarity to suggest invoice amounts based on similar invoices."""
+    _, _, invoices_collection = get_chroma()
     if not invoices_collection:
         return jsonify({'error': 'ChromaDB not initialized'}), 500
     
@@ -2516,7 +3141,7 @@ def suggest_amount_from_vectors():
         
         # Get the invoice text for semantic search
         cursor.execute('''
-            SELECT pi.invoice_text, pi.invoice_number, pi.amount, pi.currency, a.filename
+            SELECT pi.raw_text, pi.invoice_number, pi.amount, pi.currency, a.filename
             FROM parsed_invoices pi
             JOIN attachments a ON pi.attachment_id = a.id
             WHERE pi.id = ?
@@ -2524,80 +3149,51 @@ def suggest_amount_from_vectors():
         
         invoice = cursor.fetchone()
         
-        if not invoice or not invoice['invoice_text']:
+        if not invoice or not invoice['raw_text']:
             return jsonify({'error': 'Invoice not found or has no text'}), 404
         
         # Search for similar invoices in ChromaDB
         try:
-            # First check if we have indexed invoices
-            if invoices_collection.count() == 0:
-                # If not indexed, index current invoice database
-                cursor.execute('''
-                    SELECT pi.id, pi.invoice_text, pi.invoice_number, pi.amount, pi.currency
-                    FROM parsed_invoices pi
-                    WHERE pi.invoice_text IS NOT NULL AND pi.invoice_text != ''
-                ''')
-                
-                all_invoices = cursor.fetchall()
-                
-                if len(all_invoices) > 0:
-                    documents = []
-                    metadatas = []
-                    ids = []
-                    
-                    for inv in all_invoices:
-                        documents.append(inv['invoice_text'])
-                        metadatas.append({
-                            'invoice_id': inv['id'],
-                            'invoice_number': inv['invoice_number'] or '',
-                            'amount': float(inv['amount']) if inv['amount'] else 0,
-                            'currency': inv['currency'] or 'EUR'
-                        })
-                        ids.append(f"invoice_{inv['id']}")
-                    
-                    # Add to ChromaDB
-                    batch_size = 100
-                    for i in range(0, len(documents), batch_size):
-                        batch_docs = documents[i:i+batch_size]
-                        batch_metas = metadatas[i:i+batch_size]
-                        batch_ids = ids[i:i+batch_size]
-                        
-                        invoices_collection.upsert(
-                            documents=batch_docs,
-                            metadatas=batch_metas,
-                            ids=batch_ids
-                        )
+            # Without an index there is nothing to compare against; build it in the background
+            # rather than making this request wait for the whole corpus to be embedded
+            if not invoice_index_status['ready']:
+                if invoices_collection.count() == 0:
+                    start_invoice_indexing(invoices_collection)
+                    return jsonify({
+                        'success': False,
+                        'message': 'Invoices are being indexed for similarity search, please try again shortly'
+                    })
+                invoice_index_status['ready'] = True
             
             # Now perform semantic search
-            results = invoices_collection.query(
-                query_texts=[invoice['invoice_text']],
-                n_results=10,
-                include=['documents', 'metadatas', 'distances']
-            )
+            results = cached_chroma_query(invoices_collection, invoice['raw_text'], 10)
             
-            # Extract amounts from similar invoices
+            # Extract amounts from similar invoices, accumulating the weighted average as we go
             similar_amounts = []
+            total_weight = 0
+            weighted_total = 0
             if results and results['metadatas'] and len(results['metadatas']) > 0:
-                for i, metadata in enumerate(results['metadatas'][0]):
+                for metadata, distance in zip(results['metadatas'][0], results['distances'][0]):
                     # Skip self
                     if metadata.get('invoice_id') == parsed_id:
                         continue
                     
                     amount = metadata.get('amount', 0)
                     if amount and amount > 0:
-                        similarity = 1 - results['distances'][0][i]
+                        similarity = round((1 - distance) * 100, 1)
+                        total_weight += similarity
+                        weighted_total += amount * similarity
                         similar_amounts.append({
                             'amount': amount,
                             'currency': metadata.get('currency', 'EUR'),
                             'invoice_number': metadata.get('invoice_number', ''),
-                            'similarity': round(similarity * 100, 1)
+                            'similarity': similarity
                         })
             
             # Calculate suggested amount (weighted average by similarity)
             if similar_amounts:
-                total_weight = sum(a['similarity'] for a in similar_amounts)
                 if total_weight > 0:
-                    suggested_amount = sum(a['amount'] * a['similarity'] for a in similar_amounts) / total_weight
+                    suggested_amount = weighted_total / total_weight
                 else:
                     suggested_amount = similar_amounts[0]['amount']
                 
@@ -2631,7 +3227,7 @@ def get_production_feedback():
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM production_feedback ORDER BY created_at DESC')
-    feedback = [dict(row) for row in cursor.fetchall()]
+    feedback = cursor.fetchall()
     conn.close()
     
     # Parse files JSON if exists
@@ -2644,27 +3240,69 @@ def get_production_feedback():
     
     return jsonify(feedback)
 
+# Insert statements shared by the single-row and /bulk production endpoints
+PRODUCTION_FEEDBACK_INSERT = '''
+    INSERT INTO production_feedback (title, description, status, files, feedback_date)
+    VALUES (?, ?, ?, ?, ?)
+'''
+PRODUCTION_RUN_INSERT = '''
+    INSERT INTO production_runs (client, order_ref, product, quantity, status, notes, eta_month, date_ordered, price_per_roll, cost_per_roll)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+PRODUCT_INSERT = 'INSERT INTO products (name, description, price, notes) VALUES (?, ?, ?, ?)'
+CLIENT_INSERT = 'INSERT INTO clients (name, contact_info, country) VALUES (?, ?, ?)'
+
+def production_feedback_values(data):
+    """PRODUCTION_FEEDBACK_INSERT parameters for one request object."""
+    return (data.get('title', ''), data.get('description', ''), data.get('status', 'pending'),
+            json.dumps(data.get('files', [])), data.get('feedback_date'))  # feedback_date can be null
+
+def production_run_values(data):
+    """PRODUCTION_RUN_INSERT parameters for one request object."""
+    return (data.get('client'), data.get('order_ref'), data.get('product'), 
+            data.get('quantity', 0), data.get('status', 'pending'), 
+            data.get('notes', ''), data.get('eta_month'), data.get('date_ordered'), data.get('price_per_roll', 0), data.get('cost_per_roll', 0))
+
+def bulk_request_rows():
+    """Return the "rows" list of a bulk request body, or None if it isn't a list of objects."""
+    rows = (request.get_json() or {}).get('rows')
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return None
+    return rows
+
+def insert_rows(sql, values):
+    """executemany sql over values in one transaction; IntegrityError rolls back every row."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(sql, values)
+        conn.commit()
+    finally:
+        conn.close()
+
 @app.route('/api/production/feedback', methods=['POST'])
 def add_production_feedback():
     """Add new production feedback."""
     data = request.get_json() or {}
-    title = data.get('title', '')
-    description = data.get('description', '')
-    status = data.get('status', 'pending')
-    files = json.dumps(data.get('files', []))
-    feedback_date = data.get('feedback_date')  # Can be null
     
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO production_feedback (title, description, status, files, feedback_date)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (title, description, status, files, feedback_date))
+    cursor.execute(PRODUCTION_FEEDBACK_INSERT, production_feedback_values(data))
     conn.commit()
     conn.close()
     
     return jsonify({'success': True, 'message': 'Feedback added'})
 
+@app.route('/api/production/feedback/bulk', methods=['POST'])
+def add_production_feedback_bulk():
+    """Add many feedback entries in one transaction (body: {"rows": [...]})."""
+    rows = bulk_request_rows()
+    if rows is None:
+        return jsonify({'error': 'rows must be a list of objects'}), 400
+    
+    insert_rows(PRODUCTION_FEEDBACK_INSERT, [production_feedback_values(row) for row in rows])
+    return jsonify({'success': True, 'added': len(rows)})
+
 @app.route('/api/production/feedback/<int:feedback_id>', methods=['PUT'])
 def update_feedback(feedback_id):
     """Update feedback status."""
@@ -2704,9 +3342,7 @@ def get_production_runs():
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM production_runs ORDER BY eta_month ASC, created_at DESC')
-    runs = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(runs)
+    return stream_json_rows(conn, cursor)
 
 @app.route('/api/production/runs', methods=['POST'])
 def add_production_run():
@@ -2715,17 +3351,22 @@ def add_production_run():
     
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO production_runs (client, order_ref, product, quantity, status, notes, eta_month, date_ordered, price_per_roll, cost_per_roll)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (data.get('client'), data.get('order_ref'), data.get('product'), 
-          data.get('quantity', 0), data.get('status', 'pending'), 
-          data.get('notes', ''), data.get('eta_month'), data.get('date_ordered'), data.get('price_per_roll', 0), data.get('cost_per_roll', 0)))
+    cursor.execute(PRODUCTION_RUN_INSERT, production_run_values(data))
     conn.commit()
     conn.close()
     
     return jsonify({'success': True, 'message': 'Production run added'})
 
+@app.route('/api/production/runs/bulk', methods=['POST'])
+def add_production_runs_bulk():
+    """Add many production runs in one transaction (body: {"rows": [...]})."""
+    rows = bulk_request_rows()
+    if rows is None:
+        return jsonify({'error': 'rows must be a list of objects'}), 400
+    
+    insert_rows(PRODUCTION_RUN_INSERT, [production_run_values(row) for row in rows])
+    return jsonify({'success': True, 'added': len(rows)})
+
 @app.route('/api/production/runs/<int:run_id>', methods=['PUT'])
 def update_production_run(run_id):
     """Update a production run - automatically tracks updated_at."""
@@ -2773,9 +3414,7 @@ def get_products():
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM products ORDER BY name ASC')
-    products = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(products)
+    return stream_json_rows(conn, cursor)
 
 @app.route('/api/production/products', methods=['POST'])
 def add_product():
@@ -2788,7 +3427,7 @@ def add_product():
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute('INSERT INTO products (name, description, price, notes) VALUES (?, ?, ?, ?)',
+        cursor.execute(PRODUCT_INSERT,
                       (name, data.get('description', ''), data.get('price', 0), data.get('notes', '')))
         conn.commit()
         product_id = cursor.lastrowid
@@ -2797,6 +3436,24 @@ def add_product():
     except IntegrityError:
         return jsonify({'success': False, 'error': 'Product already exists'}), 400
 
+@app.route('/api/production/products/bulk', methods=['POST'])
+def add_products_bulk():
+    """Add many products in one transaction (body: {"rows": [...]}); nothing is added if any name exists."""
+    rows = bulk_request_rows()
+    if rows is None:
+        return jsonify({'success': False, 'error': 'rows must be a list of objects'}), 400
+    
+    values = [((row.get('name') or '').strip(), row.get('description', ''), row.get('price', 0), row.get('notes', ''))
+              for row in rows]
+    if not all(value[0] for value in values):
+        return jsonify({'success': False, 'error': 'Product name is required'}), 400
+    
+    try:
+        insert_rows(PRODUCT_INSERT, values)
+    except IntegrityError:
+        return jsonify({'success': False, 'error': 'Product already exists'}), 400
+    return jsonify({'success': True, 'added': len(values)})
+
 @app.route('/api/production/products/<int:product_id>', methods=['PUT'])
 def update_product(product_id):
     """Update a product."""
@@ -2833,9 +3490,7 @@ def get_client_prices():
         JOIN products p ON cpp.product_id = p.id
         ORDER BY c.name, p.name
     ''')
-    prices = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(prices)
+    return stream_json_rows(conn, cursor)
 
 @app.route('/api/production/client-prices', methods=['POST'])
 def set_client_price():
@@ -2904,9 +3559,7 @@ def get_clients():
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM clients ORDER BY name ASC')
-    clients = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(clients)
+    return stream_json_rows(conn, cursor)
 
 @app.route('/api/production/clients', methods=['POST'])
 def add_client():
@@ -2919,7 +3572,7 @@ def add_client():
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute('INSERT INTO clients (name, contact_info, country) VALUES (?, ?, ?)',
+        cursor.execute(CLIENT_INSERT,
                       (name, data.get('contact_info', ''), data.get('country', '')))
         conn.commit()
         client_id = cursor.lastrowid
@@ -2928,6 +3581,24 @@ def add_client():
     except IntegrityError:
         return jsonify({'success': False, 'error': 'Client already exists'}), 400
 
+@app.route('/api/production/clients/bulk', methods=['POST'])
+def add_clients_bulk():
+    """Add many clients in one transaction (body: {"rows": [...]}); nothing is added if any name exists."""
+    rows = bulk_request_rows()
+    if rows is None:
+        return jsonify({'success': False, 'error': 'rows must be a list of objects'}), 400
+    
+    values = [((row.get('name') or '').strip(), row.get('contact_info', ''), row.get('country', ''))
+              for row in rows]
+    if not all(value[0] for value in values):
+        return jsonify({'success': False, 'error': 'Client name is required'}), 400
+    
+    try:
+        insert_rows(CLIENT_INSERT, values)
+    except IntegrityError:
+        return jsonify({'success': False, 'error': 'Client already exists'}), 400
+    return jsonify({'success': True, 'added': len(values)})
+
 @app.route('/api/production/clients/<int:client_id>', methods=['DELETE'])
 def delete_client(client_id):
     """Delete a client."""
@@ -2947,25 +3618,14 @@ def update_client(client_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Build update query dynamically
+    # Build update query dynamically; fields are always visited in this order, so each
+    # subset maps to one SQL string and reuses the connection's cached prepared statement
     updates = []
     values = []
-    
-    if 'name' in data:
-        updates.append('name = ?')
-        values.append(data['name'])
-    if 'contact_info' in data:
-        updates.append('contact_info = ?')
-        values.append(data['contact_info'])
-    if 'billing_address' in data:
-        updates.append('billing_address = ?')
-        values.append(data['billing_address'])
-    if 'shipping_address' in data:
-        updates.append('shipping_address = ?')
-        values.append(data['shipping_address'])
-    if 'country' in data:
-        updates.append('country = ?')
-        values.append(data['country'])
+    for field in ('name', 'contact_info', 'billing_address', 'shipping_address', 'country'):
+        if field in data:
+            updates.append(f'{field} = ?')
+            values.append(data[field])
     
     if updates:
         values.append(client_id)
@@ -3004,7 +3664,7 @@ def get_latest_orders():
     for row in cursor.fetchall():
         amount = row['amount']
         if row['currency'] == 'RON' and amount:
-            amount = amount / 4.97
+            amount = amount / RON_PER_EUR
         
         orders.append({
             'id': row['id'],
@@ -3656,7 +4316,7 @@ def calendar_callback():
         tokens = response.json()
         
         if 'access_token' in tokens:
-            # Save tokens to file for persistence
+            # Save tokens to the database for persistence
             save_google_tokens(tokens)
             return redirect('/?calendar_connected=true')
         else:
@@ -3674,8 +4334,7 @@ def calendar_status():
 @app.route('/api/calendar/disconnect', methods=['POST'])
 def calendar_disconnect():
     """Disconnect Google Calendar."""
-    if os.path.exists(GOOGLE_TOKEN_FILE):
-        os.remove(GOOGLE_TOKEN_FILE)
+    clear_google_tokens()
     return jsonify({'success': True})
 
 @app.route('/api/calendar/events')
@@ -3705,8 +4364,7 @@ def get_calendar_events():
         cal_response = requests.get(calendars_url, headers=headers)
         
         if cal_response.status_code == 401:
-            if os.path.exists(GOOGLE_TOKEN_FILE):
-                os.remove(GOOGLE_TOKEN_FILE)
+            expire_google_token(access_token)
             return jsonify({'error': 'Token expired', 'events': []})
         
         calendars_data = cal_response.json()
@@ -3797,8 +4455,7 @@ def get_calendar_tasks():
         
         lists_response = requests.get(lists_url, headers=headers)
         if lists_response.status_code == 401:
-            if os.path.exists(GOOGLE_TOKEN_FILE):
-                os.remove(GOOGLE_TOKEN_FILE)
+            expire_google_token(access_token)
             return jsonify({'error': 'Token expired', 'tasks': []})
         
         lists_data = lists_response.json()
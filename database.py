@@ -2,7 +2,9 @@
 Database abstraction layer supporting both SQLite (local) and PostgreSQL (Railway).
 """
 import os
+import re
 import sqlite3
+import threading
 from contextlib import contextmanager
 
 # Check for PostgreSQL connection string (Railway provides DATABASE_URL)
@@ -14,6 +16,7 @@ USE_POSTGRES = DATABASE_URL is not None
 if USE_POSTGRES:
     import psycopg2
     from psycopg2.extras import RealDictCursor
+    from psycopg2.pool import ThreadedConnectionPool, PoolError
     from psycopg2 import IntegrityError as PgIntegrityError
     # Fix Railway's postgres:// URL to postgresql://
     if DATABASE_URL.startswith('postgres://'):
@@ -26,6 +29,60 @@ else:
 # SQLite path for local development
 SQLITE_PATH = 'email_archive.db'
 
+# Per-connection SQLite tuning: 256 MB mmap, 64 MB page cache, in-memory temp tables
+SQLITE_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA mmap_size=268435456;'
+    'PRAGMA cache_size=-65536;'
+    'PRAGMA temp_store=MEMORY;'
+)
+_sqlite_wal_enabled = False
+
+# Debug aid: SQLITE_CHECK_QUERY_PLANS=1 logs each SELECT shape whose plan
+# falls back to a full table scan (see _check_query_plan)
+SQLITE_CHECK_QUERY_PLANS = os.environ.get('SQLITE_CHECK_QUERY_PLANS') == '1'
+SQLITE_FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+# Trace callbacks see the SQL with bound values inlined; literals are masked so each
+# statement shape is only explained once, and the set is capped regardless
+SQLITE_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQLITE_QUERY_PLANS_MAX = 1000
+_query_plan_conn = None
+_query_plan_lock = threading.Lock()
+_query_plans_checked = set()
+# Bump whenever _init_sqlite_tables changes so existing databases re-run it
+SQLITE_SCHEMA_VERSION = 9
+
+# SQLite FTS5 indexes (<table>_fts) kept in sync by triggers; Postgres keeps using LIKE
+FTS_TABLES = {
+    'emails': ('subject', 'body_text', 'from_address'),
+    'products': ('name', 'description', 'notes'),
+    'production_runs': ('client', 'product', 'order_ref', 'notes'),
+    'clients': ('name', 'contact_info'),
+}
+
+# parsed_invoices columns caching the DFW tab's regex extraction (NULL is_dfw = not yet classified)
+DFW_INVOICE_COLUMNS = (
+    ('is_dfw', 'INTEGER'),
+    ('dfw_invoice_number', 'INTEGER'),
+    ('dfw_amount', 'REAL'),
+    ('dfw_date', 'TEXT'),
+    ('dfw_recipient', 'TEXT'),
+)
+
+# app_settings counter bumped by triggers on every parsed_invoices write, so
+# in-memory invoice caches can tell when to reload
+PARSED_INVOICES_VERSION_SETTING = 'parsed_invoices_version'
+# Same idea for entity_categories, whose updated_at only has second resolution
+ENTITY_CATEGORIES_VERSION_SETTING = 'entity_categories_version'
+
+# One reusable SQLite connection per worker thread, see checkout_thread_sqlite()
+_sqlite_local = threading.local()
+
+# Shared PostgreSQL connections, created on first use; see checkout_postgres()
+PG_POOL_MAX = int(os.environ.get('PG_POOL_MAX', '10'))
+_pg_pool = None
+_pg_pool_lock = threading.Lock()
+
 
 class DictRow(dict):
     """A dict subclass that allows attribute access like sqlite3.Row."""
@@ -39,12 +96,19 @@ class DictRow(dict):
         return super().keys()
 
 
+# (cursor.description, column names) of the last result set dict_factory saw;
+# description is one tuple per executed statement, so identity is a safe key
+_dict_factory_columns = (None, ())
+
+
 def dict_factory(cursor, row):
     """Convert SQLite rows to dictionaries."""
-    d = DictRow()
-    for idx, col in enumerate(cursor.description):
-        d[col[0]] = row[idx]
-    return d
+    global _dict_factory_columns
+    description = cursor.description
+    columns = _dict_factory_columns
+    if columns[0] is not description:
+        columns = _dict_factory_columns = (description, tuple(col[0] for col in description))
+    return DictRow(zip(columns[1], row))
 
 
 @contextmanager
@@ -62,8 +126,7 @@ def get_db_connection():
         finally:
             conn.close()
     else:
-        conn = sqlite3.connect(SQLITE_PATH)
-        conn.row_factory = dict_factory
+        conn = connect_sqlite()
         try:
             yield conn
             conn.commit()
@@ -74,6 +137,90 @@ def get_db_connection():
             conn.close()
 
 
+def connect_sqlite():
+    """Open a SQLite connection with WAL and the SQLITE_PRAGMAS tuning applied."""
+    global _sqlite_wal_enabled
+    conn = sqlite3.connect(SQLITE_PATH, check_same_thread=False)
+    conn.row_factory = dict_factory
+    if not _sqlite_wal_enabled:
+        # journal_mode is stored in the database file, so once per process is enough
+        conn.execute('PRAGMA journal_mode=WAL')
+        _sqlite_wal_enabled = True
+    conn.executescript(SQLITE_PRAGMAS)
+    if SQLITE_CHECK_QUERY_PLANS:
+        conn.set_trace_callback(_check_query_plan)
+    return conn
+
+
+def _check_query_plan(statement):
+    """Trace callback printing the full table scans in a SELECT's plan.
+    
+    The statement arrives with its parameters expanded, so it is deduplicated on
+    its shape with literals masked, for at most SQLITE_QUERY_PLANS_MAX shapes.
+    """
+    global _query_plan_conn
+    if not statement.lstrip()[:6].upper().startswith(('SELECT', 'WITH')):
+        return
+    shape = SQLITE_LITERAL_RE.sub('?', statement)
+    with _query_plan_lock:
+        if shape in _query_plans_checked or len(_query_plans_checked) >= SQLITE_QUERY_PLANS_MAX:
+            return
+        _query_plans_checked.add(shape)
+        # A separate connection, since the traced one is busy running the statement
+        if _query_plan_conn is None:
+            _query_plan_conn = sqlite3.connect(SQLITE_PATH, check_same_thread=False)
+        try:
+            plan = _query_plan_conn.execute(f'EXPLAIN QUERY PLAN {statement}').fetchall()
+        except sqlite3.Error:
+            return
+    scans = [m.group(1) for m in (SQLITE_FULL_SCAN_RE.match(row[3]) for row in plan) if m]
+    if scans:
+        print(f"Full table scan of {', '.join(scans)}: {' '.join(statement.split())[:200]}")
+
+
+def checkout_thread_sqlite():
+    """Check out this thread's pooled SQLite connection, or return None if it is already in use."""
+    slot = getattr(_sqlite_local, 'slot', None)
+    if slot is None:
+        slot = _sqlite_local.slot = {'conn': connect_sqlite(), 'in_use': False}
+    if slot['in_use']:
+        return None
+    slot['in_use'] = True
+    return slot
+
+
+def release_thread_sqlite(slot):
+    """Hand a pooled connection back, discarding anything left uncommitted as close() would."""
+    if slot['conn'].in_transaction:
+        slot['conn'].rollback()
+    slot['in_use'] = False
+
+
+def checkout_postgres():
+    """Borrow a pooled PostgreSQL connection, or return None if the pool is exhausted."""
+    global _pg_pool
+    if _pg_pool is None:
+        with _pg_pool_lock:
+            if _pg_pool is None:
+                _pg_pool = ThreadedConnectionPool(1, PG_POOL_MAX, DATABASE_URL)
+    try:
+        conn = _pg_pool.getconn()
+    except PoolError:
+        return None
+    conn.autocommit = False
+    return conn
+
+
+def release_postgres(conn):
+    """Return a pooled connection, discarding anything left uncommitted as close() would."""
+    try:
+        if not conn.closed:
+            conn.rollback()
+    except psycopg2.Error:
+        pass
+    _pg_pool.putconn(conn, close=bool(conn.closed))
+
+
 def get_cursor(conn):
     """Get a cursor with dict-like row access."""
     if USE_POSTGRES:
@@ -85,13 +232,21 @@ def get_cursor(conn):
 class DatabaseConnection:
     """Backward-compatible database connection that works both as context manager and regular object."""
     def __init__(self):
+        self._pool_slot = None
+        self._pg_pooled = None
         if USE_POSTGRES:
-            self.conn = psycopg2.connect(DATABASE_URL)
-            self.conn.autocommit = False
+            self._pg_pooled = checkout_postgres()
+            if self._pg_pooled is not None:
+                self.conn = self._pg_pooled
+            else:
+                self.conn = psycopg2.connect(DATABASE_URL)
+                self.conn.autocommit = False
         else:
-            self.conn = sqlite3.connect(SQLITE_PATH)
-            self.conn.row_factory = dict_factory
-        self._should_close = True
+            # Reuse the thread's connection; nested callers get their own so
+            # an inner close() can't roll back the outer caller's writes
+            self._pool_slot = checkout_thread_sqlite()
+            self.conn = self._pool_slot['conn'] if self._pool_slot else connect_sqlite()
+        self._should_close = self._pool_slot is None and self._pg_pooled is None
     
     def cursor(self, cursor_factory=None):
         """Get a cursor with dict-like row access."""
@@ -113,9 +268,22 @@ class DatabaseConnection:
     
     def close(self):
         """Close the connection."""
-        if self._should_close:
+        if self._pool_slot is not None:
+            release_thread_sqlite(self._pool_slot)
+            self._pool_slot = None
+        elif self._pg_pooled is not None:
+            release_postgres(self._pg_pooled)
+            self._pg_pooled = None
+        elif self._should_close:
             self.conn.close()
     
+    def __del__(self):
+        # Callers that never close() still return the pooled connection
+        if getattr(self, '_pool_slot', None) is not None:
+            release_thread_sqlite(self._pool_slot)
+        elif getattr(self, '_pg_pooled', None) is not None:
+            release_postgres(self._pg_pooled)
+    
     def __enter__(self):
         return self
     
@@ -174,7 +342,14 @@ def init_all_tables():
         if USE_POSTGRES:
             _init_postgres_tables(cursor)
         else:
+            # Cheap on a current database; refreshes stale planner statistics after bulk imports
+            cursor.execute('PRAGMA optimize')
+            # Skip the DDL entirely once this schema version has been applied
+            cursor.execute('PRAGMA user_version')
+            if cursor.fetchone()['user_version'] >= SQLITE_SCHEMA_VERSION:
+                return
             _init_sqlite_tables(cursor)
+            cursor.execute(f'PRAGMA user_version = {SQLITE_SCHEMA_VERSION}')
         
         conn.commit()
 
@@ -259,6 +434,16 @@ def _init_postgres_tables(cursor):
         )
     ''')
     
+    # Organisation billing/shipping details table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS organisation_details (
+            domain TEXT PRIMARY KEY,
+            billing_address TEXT,
+            shipping_address TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     # Organization files table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS organization_files (
@@ -393,12 +578,78 @@ def _init_postgres_tables(cursor):
     # Create indexes
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_from ON emails(from_address)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_date ON emails(date_received DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_from_date ON emails(from_address, date_received DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_read_status ON email_read_status(email_id, is_read)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_subject ON emails(subject)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_attachments_email ON attachments(email_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_attachments_filename ON attachments(filename)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_org_files_domain ON organization_files(domain)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_production_runs_client ON production_runs(client)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_production_runs_status ON production_runs(status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_production_runs_eta_created ON production_runs(eta_month, created_at DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parsed_invoices_attachment_id ON parsed_invoices(attachment_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parsed_invoices_email_id ON parsed_invoices(email_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parsed_invoices_assigned_tab ON parsed_invoices(assigned_tab)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parsed_invoices_assigned_hidden ON parsed_invoices(assigned_tab, hidden)')
+    
+    # DFW fields precomputed by get_dfw_invoices and the tab detected by get_all_attachments;
+    # both are reset whenever raw_text changes
+    for column, column_type in DFW_INVOICE_COLUMNS:
+        cursor.execute(f'ALTER TABLE parsed_invoices ADD COLUMN IF NOT EXISTS {column} {column_type}')
+    cursor.execute('ALTER TABLE parsed_invoices ADD COLUMN IF NOT EXISTS detected_tab TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parsed_invoices_is_dfw ON parsed_invoices(is_dfw)')
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION parsed_invoices_reset_dfw() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.raw_text IS DISTINCT FROM OLD.raw_text THEN
+                NEW.is_dfw := NULL;
+                NEW.detected_tab := NULL;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS parsed_invoices_reset_dfw ON parsed_invoices')
+    cursor.execute('''
+        CREATE TRIGGER parsed_invoices_reset_dfw BEFORE UPDATE ON parsed_invoices
+        FOR EACH ROW EXECUTE FUNCTION parsed_invoices_reset_dfw()
+    ''')
+    
+    cursor.execute('''
+        INSERT INTO app_settings (key, value) VALUES (%s, '0') ON CONFLICT (key) DO NOTHING
+    ''', (PARSED_INVOICES_VERSION_SETTING,))
+    cursor.execute(f'''
+        CREATE OR REPLACE FUNCTION parsed_invoices_bump_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE app_settings SET value = (value::bigint + 1)::text
+            WHERE key = '{PARSED_INVOICES_VERSION_SETTING}';
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS parsed_invoices_bump_version ON parsed_invoices')
+    cursor.execute('''
+        CREATE TRIGGER parsed_invoices_bump_version AFTER INSERT OR UPDATE OR DELETE ON parsed_invoices
+        FOR EACH STATEMENT EXECUTE FUNCTION parsed_invoices_bump_version()
+    ''')
+    
+    cursor.execute('''
+        INSERT INTO app_settings (key, value) VALUES (%s, '0') ON CONFLICT (key) DO NOTHING
+    ''', (ENTITY_CATEGORIES_VERSION_SETTING,))
+    cursor.execute(f'''
+        CREATE OR REPLACE FUNCTION entity_categories_bump_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE app_settings SET value = (value::bigint + 1)::text
+            WHERE key = '{ENTITY_CATEGORIES_VERSION_SETTING}';
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS entity_categories_bump_version ON entity_categories')
+    cursor.execute('''
+        CREATE TRIGGER entity_categories_bump_version AFTER INSERT OR UPDATE OR DELETE ON entity_categories
+        FOR EACH STATEMENT EXECUTE FUNCTION entity_categories_bump_version()
+    ''')
 
 
 def _init_sqlite_tables(cursor):
@@ -479,6 +730,16 @@ def _init_sqlite_tables(cursor):
         )
     ''')
     
+    # Organisation billing/shipping details table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS organisation_details (
+            domain TEXT PRIMARY KEY,
+            billing_address TEXT,
+            shipping_address TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     # Organization files table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS organization_files (
@@ -615,12 +876,105 @@ def _init_sqlite_tables(cursor):
     # Create indexes
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_from ON emails(from_address)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_date ON emails(date_received DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_from_date ON emails(from_address, date_received DESC)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_subject ON emails(subject)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_attachments_email ON attachments(email_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_attachments_filename ON attachments(filename)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_org_files_domain ON organization_files(domain)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_production_runs_client ON production_runs(client)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_production_runs_status ON production_runs(status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_production_runs_eta_created ON production_runs(eta_month, created_at DESC)')
+    
+    # parsed_invoices columns depend on whether email_archiver or this module created the table
+    cursor.execute('PRAGMA table_info(parsed_invoices)')
+    invoice_columns = {row['name'] for row in cursor.fetchall()}
+    for column in ('attachment_id', 'email_id', 'assigned_tab'):
+        if column in invoice_columns:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_parsed_invoices_{column} ON parsed_invoices({column})')
+    if {'assigned_tab', 'hidden'} <= invoice_columns:
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_parsed_invoices_assigned_hidden ON parsed_invoices(assigned_tab, hidden)')
+    
+    # DFW fields precomputed by get_dfw_invoices and the tab detected by get_all_attachments;
+    # both are reset whenever raw_text changes
+    for column, column_type in DFW_INVOICE_COLUMNS + (('detected_tab', 'TEXT'),):
+        if column not in invoice_columns:
+            cursor.execute(f'ALTER TABLE parsed_invoices ADD COLUMN {column} {column_type}')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parsed_invoices_is_dfw ON parsed_invoices(is_dfw)')
+    cursor.execute('DROP TRIGGER IF EXISTS parsed_invoices_reset_dfw')
+    cursor.execute('''
+        CREATE TRIGGER parsed_invoices_reset_dfw AFTER UPDATE OF raw_text ON parsed_invoices
+        BEGIN
+            UPDATE parsed_invoices SET is_dfw = NULL, detected_tab = NULL WHERE id = new.id;
+        END
+    ''')
+    
+    cursor.execute("INSERT OR IGNORE INTO app_settings (key, value) VALUES (?, '0')",
+                   (PARSED_INVOICES_VERSION_SETTING,))
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS parsed_invoices_bump_version_{event.lower()}
+            AFTER {event} ON parsed_invoices
+            BEGIN
+                UPDATE app_settings SET value = CAST(value AS INTEGER) + 1
+                WHERE key = '{PARSED_INVOICES_VERSION_SETTING}';
+            END
+        ''')
+    
+    cursor.execute("INSERT OR IGNORE INTO app_settings (key, value) VALUES (?, '0')",
+                   (ENTITY_CATEGORIES_VERSION_SETTING,))
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS entity_categories_bump_version_{event.lower()}
+            AFTER {event} ON entity_categories
+            BEGIN
+                UPDATE app_settings SET value = CAST(value AS INTEGER) + 1
+                WHERE key = '{ENTITY_CATEGORIES_VERSION_SETTING}';
+            END
+        ''')
+    
+    _init_sqlite_fts(cursor)
+
+
+def _init_sqlite_fts(cursor):
+    """Create the FTS_TABLES indexes and their sync triggers, backfilling on first creation."""
+    for table, columns in FTS_TABLES.items():
+        fts = f'{table}_fts'
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,))
+        if cursor.fetchone():
+            continue
+        
+        cols = ', '.join(columns)
+        new_cols = ', '.join(f'new.{c}' for c in columns)
+        old_cols = ', '.join(f'old.{c}' for c in columns)
+        try:
+            cursor.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id')")
+        except sqlite3.OperationalError as e:
+            print(f"FTS5 not available, search falls back to LIKE: {e}")
+            return
+        
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        ''')
+        cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def fts_match_expression(text):
+    """Build an FTS5 MATCH expression that ORs the quoted words of free text."""
+    words = [w for w in re.findall(r'\w+', text) if len(w) > 2]
+    return ' OR '.join(f'"{w}"' for w in words)
 
 
 def get_setting(key, default=None):
@@ -647,3 +1001,12 @@ def set_setting(key, value):
                 INSERT OR REPLACE INTO app_settings (key, value, updated_at) 
                 VALUES (?, ?, CURRENT_TIMESTAMP)
             ''', (key, value))
+
+
+def delete_setting(key, value=None):
+    """Delete a setting from the database; with value, only if it still holds that value."""
+    with get_db_connection() as conn:
+        if value is None:
+            execute_query(conn, 'DELETE FROM app_settings WHERE key = ?', (key,))
+        else:
+            execute_query(conn, 'DELETE FROM app_settings WHERE key = ? AND value = ?', (key, value))
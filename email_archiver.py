@@ -64,9 +64,17 @@ class EmailArchiver:
         if ADOBE_OCR_SUPPORT:
             self._init_adobe_services()
         
+    def _connect(self):
+        """Open a connection with the same WAL/synchronous settings the web app uses."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+        
     def _init_db(self):
         """Initialize the SQLite database."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
+            # journal_mode is persistent, so the web app's readers no longer block on our writes
+            conn.execute('PRAGMA journal_mode=WAL')
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS emails (
@@ -250,6 +258,11 @@ class EmailArchiver:
             
             logging.info(f"Successfully saved {saved_count} emails to the database.")
             
+            if saved_count:
+                # Refresh planner statistics so the new rows use the covering indexes
+                with self._connect() as conn:
+                    conn.execute('ANALYZE')
+            
         except Exception as e:
             logging.error(f"Error downloading emails: {str(e)}")
     
@@ -284,7 +297,7 @@ class EmailArchiver:
             # Get all headers
             headers = '\n'.join(f"{k}: {v}" for k, v in email_message.items())
             
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 # Add folder column if it doesn't exist
                 try:
@@ -362,7 +375,7 @@ class EmailArchiver:
                     content_type = part.get_content_type()
                     file_size = len(payload)
                     
-                    with sqlite3.connect(self.db_path) as conn:
+                    with self._connect() as conn:
                         cursor = conn.cursor()
                         cursor.execute('''
                             INSERT INTO attachments 
@@ -467,7 +480,7 @@ class EmailArchiver:
             
             # Save parsed data
             if invoice_number or amount:
-                with sqlite3.connect(self.db_path) as conn:
+                with self._connect() as conn:
                     cursor = conn.cursor()
                     cursor.execute('''
                         INSERT INTO parsed_invoices 
@@ -531,7 +544,7 @@ class EmailArchiver:
     def list_emails(self, limit: int = 10):
         """List emails from the database."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute('''
@@ -570,7 +583,7 @@ class EmailArchiver:
     def get_email(self, email_id: int):
         """Get full email details by ID."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute('SELECT * FROM emails WHERE id = ?', (email_id,))